@@ -0,0 +1,68 @@
+"""
+Text-cleaning benchmark — pre_clean / is_good / is_fallback against the old per-pattern versions.
+
+Corpus: bench/corpus/*.txt plus every PDF text and summary in the local store (CSE_DB), so running it on
+a machine that has tracked for a while measures real disclosures. Outputs that differ from the old
+implementation are counted; a jump there is a behaviour regression, not just a speed one.
+
+Usage:
+  python bench/bench_clean.py [rounds]
+"""
+import os, re, sys, glob, time, sqlite3
+HERE=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+import cse_tracker_v9 as t
+
+SUMMARIES = ["Hayleys Fabric PLC declared a first interim dividend of Rs. 1.25 per share, payable on or before 04 April 2025.",
+    "Unfortunately, the provided text does not contain sufficient information.",
+    "Here are the specific facts: the company will hold its AGM on 28 June 2025.",
+    "JKH — DEALINGS BY DIRECTORS.", "", "Company registration number PQ 12 was referenced without further detail.",
+    "A director purchased 250,000 shares at Rs. 19.80 each, raising the holding to 0.09%."]
+
+def old_pre_clean(t):
+    if not t: return ""
+    for p in [r'Yours\s+(faithfully|sincerely|truly).*',r'BY\s+ORDER\s+OF\s+THE\s+BOARD.*',r'For\s+and\s+on\s+behalf\s+of.*']:
+        t = re.sub(p,'',t,flags=re.IGNORECASE|re.DOTALL)
+    for p in [r'Dear\s+(Sir|Madam|Madan-?r?|Sirs?)[\s,]*',r'Ms\.?\s+Nilupa\s+Perar?a.{0,100}',r'Mrs\.?\s+Nilupa\s+Perar?a.{0,100}',
+        r'Chief\s+Regulatory\s+Officer.{0,100}',r'Colombo\s+Stock\s+Exc[a-z]*.{0,100}',r'Echelon\s+Square.{0,60}',
+        r'World\s*\'?[Tt]rade\s+Centr?e.{0,60}',r'West\s+Block.{0,60}',
+        r'#?\d+[-/]?\d*,?\s*\w+\s+(Road|Street|Lane|Mawatha|Place).{0,80}',r'Colombo\s*\d{1,2}.{0,40}',r'Sri\s+Lanka\.?',
+        r'Tel(?:ephone)?:?\s*[\+\d\s\-\(\)\']{5,30}',r'Fax:?\s*[\+\d\s\-\(\)\']{5,30}',r'E-?mail:?\s*\S+@\S+',
+        r'P\s*W\s*(?:Corporate|Gorporate)\s*Secretarial.{0,80}',r'M&S\s*Managers\s*&\s*Secretaries.{0,80}',
+        r'JACEY\s*&?\s*(?:COMPANY|GOMPANY).{0,80}',r'JULIUS\s*&?\s*CREASY.{0,80}']:
+        t = re.sub(p,' ',t,flags=re.IGNORECASE)
+    return re.sub(r'\s+',' ',re.sub(r'[!.]{2,}','.',re.sub(r'[{}\[\]|\\@#$^~`]','',t))).strip()[:3000]
+
+def old_is_good(s):
+    if not s or len(s)<20 or len(s)>800 or len(s.split())<5: return False
+    sl=s.lower()
+    return not any(p in sl for p in t.NOT_GOOD)
+
+def old_is_fallback(s):
+    if not s: return True
+    sl=s.lower()
+    return any(b in sl for b in t.FALLBACK)
+
+def corpus():
+    texts=[open(f,encoding="utf-8").read() for f in sorted(glob.glob(os.path.join(HERE,"corpus","*.txt")))]; sums=list(SUMMARIES)
+    if t.DB_PATH and os.path.exists(t.DB_PATH):
+        db=sqlite3.connect(t.DB_PATH)
+        texts+=[r[0] for r in db.execute("SELECT text FROM pdfs WHERE text IS NOT NULL AND text<>''")]
+        sums+=[r[0] for r in db.execute("SELECT summary FROM rows WHERE summary IS NOT NULL")]
+    return texts,sums
+
+def bench(fn, xs, rounds):
+    t0=time.perf_counter()
+    for _ in range(rounds):
+        for x in xs: fn(x)
+    return (time.perf_counter()-t0)*1e6/(rounds*len(xs))
+
+if __name__=="__main__":
+    rounds=int(sys.argv[1]) if len(sys.argv)>1 else 50
+    texts,sums=corpus()
+    print(f"corpus: {len(texts)} texts ({sum(map(len,texts))/1024:.0f} KiB), {len(sums)} summaries, {rounds} rounds")
+    print(f"{'function':<12} {'old µs':>10} {'new µs':>10} {'speedup':>8} {'differ':>7}")
+    for name,old,new,xs in (("pre_clean",old_pre_clean,t.pre_clean,texts),("is_good",old_is_good,t.is_good,sums),
+                            ("is_fallback",old_is_fallback,t.is_fallback,sums)):
+        o=bench(old,xs,rounds); n=bench(new,xs,rounds); diff=sum(old(x)!=new(x) for x in xs)
+        print(f"{name:<12} {o:>10.1f} {n:>10.1f} {o/n:>7.1f}x {diff:>7}")
@@ -0,0 +1,37 @@
+"""
+Dedup benchmark — KeyIndex vs the old linear prefix scan.
+
+Usage:
+  python bench/bench_dedup.py
+"""
+import os, sys, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cse_tracker_v9 import KeyIndex
+
+def make_keys(n):
+    keys=[]
+    for i in range(n):
+        k=f"{i%28+1:02d} JAN 2025|{i%12+1:02d}:{i%60:02d}:{i%59:02d} AM|COMPANY {i} PLC"
+        if i%7==0: keys += [f"{k}|PDF1", f"{k}|PDF2"]
+        else: keys.append(k)
+    return keys
+
+def probes(n, m=100):
+    r=random.Random(1); return [f"{i%28+1:02d} JAN 2025|{i%12+1:02d}:{i%60:02d}:{i%59:02d} AM|COMPANY {i} PLC" for i in (r.randrange(n*2) for _ in range(m))]
+
+def run(n, linear):
+    keys=make_keys(n); ps=probes(n)
+    if linear:
+        ek=set(keys); t=time.perf_counter()
+        hits=sum(1 for u in ps if u in ek or any(k.startswith(u) for k in ek))
+    else:
+        ek=KeyIndex(keys); t=time.perf_counter()
+        hits=sum(1 for u in ps if u in ek)
+    return (time.perf_counter()-t)*1000, hits
+
+if __name__=="__main__":
+    print(f"{'rows':>8} {'linear ms':>10} {'index ms':>10} hits")
+    for n in (1_000, 10_000, 50_000, 100_000):
+        lt,lh=run(n,True); it,ih=run(n,False)
+        assert lh==ih, (lh,ih)
+        print(f"{n:>8} {lt:>10.2f} {it:>10.3f} {ih}")
@@ -0,0 +1,207 @@
+"""
+Pipeline benchmark — run_headless, process_one_item, fix_old_summaries and download_pdf_text end to end,
+fully offline: CSE payloads and PDFs come from bench/fixtures (see fixtures/build.py), the sheet is an
+in-memory worksheet and Groq/Gemini are a stub with configurable latency and 429 rate.
+
+Every (sheet size, scenario) runs in its own process with a cold cache, so peak RSS is per scenario.
+Reports throughput, p50/p95 per stage, request counts by service and peak RSS.
+
+Usage:
+  python bench/bench_pipeline.py                          ← sheet sizes 1000, 10000, 50000
+  python bench/bench_pipeline.py --sizes 1000 --llm-latency 0.5 --llm-429 0.1
+  python bench/bench_pipeline.py --recent-rows 5000        ← sheet partitioned into a recent tab + archive
+  python bench/bench_pipeline.py --save base.json         ← baseline; later runs take --compare base.json
+"""
+import os, re, sys, io, json, time, random, argparse, tempfile, threading, subprocess, contextlib, resource
+from collections import Counter, defaultdict
+HERE=os.path.dirname(os.path.abspath(__file__)); FIX=os.path.join(HERE,"fixtures")
+SCENARIOS=("pdf","one_item","fix","headless")
+STAGES=("get_detail","_fetch_pdf","extract_pdf_text","download_pdf_text","ai_summarize","ai_summarize_batch","gather_item","finish_item")
+
+# ─── STAND-INS ────────────────────────────────────────────────────────
+class Resp:
+    def __init__(self, status=200, body=b"", headers=None):
+        self.status_code=status; self.content=body if isinstance(body,bytes) else json.dumps(body).encode(); self.headers=headers or {}
+    def json(self): return json.loads(self.content)
+    def iter_content(self, n): return (self.content[i:i+n] for i in range(0,len(self.content),n))
+    def raise_for_status(self):
+        if self.status_code>=400: raise RuntimeError(f"HTTP {self.status_code}")
+    def close(self): pass
+
+class Stub:
+    """Replaces cse_tracker_v9.http: CSE endpoints and the CDN from fixtures, LLMs synthesized."""
+    def __init__(self, cse_latency, llm_latency, llm_429, seed=1):
+        load=lambda n: json.load(open(os.path.join(FIX,n+".json")))
+        self.anns=load("approvedAnnouncement"); self.fins=load("getFinancialAnnouncement"); self.details=load("getAnnouncementById")
+        self.pdfs={f:os.path.join(FIX,"pdf",f) for f in os.listdir(os.path.join(FIX,"pdf"))}
+        self.cse_latency=cse_latency; self.llm_latency=llm_latency; self.llm_429=llm_429
+        self.rnd=random.Random(seed); self.lock=threading.Lock(); self.requests=Counter()
+    def pdf(self, url):
+        b=url.rsplit("/",1)[-1].replace("%20"," ")
+        name=next((n for n in self.pdfs if b==n or b.endswith("_"+n)),None)
+        return open(self.pdfs[name],"rb").read() if name else None
+    def http(self, method, service, url, timeout, **kw):
+        with self.lock: self.requests[service]+=1; hit429=self.rnd.random()<self.llm_429
+        if service=="cse":
+            time.sleep(self.cse_latency); ep=url.rsplit("/",1)[-1]
+            if ep=="approvedAnnouncement": return Resp(200,self.anns)
+            if ep=="getFinancialAnnouncement": return Resp(200,self.fins)
+            d=self.details.get(str((kw.get("data") or {}).get("announcementId")))
+            return Resp(200,d) if d and ep=="getAnnouncementById" else Resp(200,b"")
+        if service=="cdn":
+            time.sleep(self.cse_latency); body=self.pdf(url)
+            return Resp(200,body,{"Content-Length":str(len(body))}) if body else Resp(404)
+        time.sleep(self.llm_latency)
+        if hit429: return Resp(429,{"error":"rate limited"})
+        body=kw.get("json") or {}
+        prompt=body["messages"][-1]["content"] if "messages" in body else body["contents"][0]["parts"][0]["text"]
+        batch="response_format" in body or "responseMimeType" in body.get("generationConfig",{})
+        txt=json.dumps({i:self.summary(c) for i,c in re.findall(r'### ID (d\d+)\nCompany: ([^\n]*)',prompt)}) if batch else \
+            self.summary((re.search(r'Company: ([^\n]*)',prompt) or [None,""])[1])
+        return Resp(200,{"choices":[{"message":{"content":txt}}]} if service=="groq" else {"candidates":[{"content":{"parts":[{"text":txt}]}}]})
+    @staticmethod
+    def summary(co):
+        return f"{co} announced a cash dividend of Rs. 2.50 per share, payable on or before 04 April 2025 to holders on record."
+
+class FakeWorksheet:
+    """The slice of gspread.Worksheet the tracker uses, in memory, with optional per-call latency."""
+    def __init__(self, rows, latency=0.0, title="Sheet1", calls=None):
+        self.rows=rows; self.latency=latency; self.title=title; self.calls=Counter() if calls is None else calls
+    def _call(self, name): self.calls[name]+=1; time.sleep(self.latency)
+    def row_values(self, n): self._call("row_values"); return list(self.rows[n-1]) if n<=len(self.rows) else []
+    def col_values(self, c): self._call("col_values"); return [r[c-1] if len(r)>=c else "" for r in self.rows]
+    def update(self, rng, values):
+        self._call("update")
+        if self.rows: self.rows[0]=list(values[0])
+        else: self.rows.append(list(values[0]))
+    def get(self, rng):
+        self._call("get"); m=re.match(r'([A-Z])(\d+):([A-Z])(\d*)$',rng); c0,r0,c1=ord(m[1])-65,int(m[2]),ord(m[3])-65
+        return [r[c0:c1+1] for r in self.rows[r0-1:int(m[4]) if m[4] else None]]
+    def delete_rows(self, start, end): self._call("delete_rows"); del self.rows[start-1:end]
+    def get_all_values(self): self._call("get_all_values"); return [list(r) for r in self.rows]
+    def append_rows(self, rows, value_input_option=None):
+        self._call("append_rows"); n=len(self.rows)+1; self.rows.extend([str(v) for v in r] for r in rows)
+        return {"updates":{"updatedRange":f"{self.title}!A{n}:I{n+len(rows)-1}"}}
+    def batch_get(self, ranges):
+        self._call("batch_get"); out=[]
+        for rng in ranges:
+            m=re.match(r'([A-Z])(\d+):([A-Z])(\d*)$',rng); c0,r0,c1=ord(m[1])-65,int(m[2]),ord(m[3])-65
+            out.append([r[c0:c1+1] for r in self.rows[r0-1:int(m[4]) if m[4] else None]])
+        return out
+    def batch_update(self, data, value_input_option=None):
+        self._call("batch_update")
+        for d in data:
+            rn=int(d["range"][1:]); row=self.rows[rn-1]; row+=[""]*(9-len(row)); row[5]=d["values"][0][0]
+
+class FakeSpreadsheet:
+    """Tabs by title; the first is the recent tab. All tabs share one call counter."""
+    def __init__(self, sheet): self.sheet1=sheet; self.tabs=[sheet]
+    def worksheets(self): self.sheet1._call("worksheets"); return list(self.tabs)
+    def add_worksheet(self, title, rows, cols):
+        self.sheet1._call("add_worksheet"); ws=FakeWorksheet([],self.sheet1.latency,title,self.sheet1.calls); self.tabs.append(ws); return ws
+
+def seed_rows(n, headers, anns, broken=0):
+    """n existing sheet rows that do not collide with the fixtures; the last `broken` have fallback summaries
+    and point at fixture announcements/PDFs, for fix_old_summaries to repair."""
+    rows=[list(headers)]
+    for i in range(n-broken):
+        ds=f"{i%28+1:02d} JAN 2024"; ts=f"{i%12+1:02d}:{i%60:02d}:{i%59:02d} AM"; co=f"COMPANY {i%900} PLC"
+        rows.append([ds,ts,co,"GENERAL","",f"{co} announced a change to its board of directors effective 1 January 2024.","",0,f"{ds}|{ts}|{co}|{i}"])
+    for i in range(broken):
+        a=anns[i%len(anns)]; co=a["company"]; cat=a["announcementCategory"]; ds="02 FEB 2024"; ts=f"10:{i%60:02d}:00 AM"
+        rows.append([ds,ts,co,cat,"","" if i%2 else "Unfortunately, the provided text does not contain the key details.",f"https://cdn.cse.lk/upload_report_file/fix{i}_dealings.pdf",1,f"{ds}|{ts}|{co}|fix{i}"])
+    return rows
+
+# ─── CHILD: ONE SCENARIO ──────────────────────────────────────────────
+def child(size, scenario, a):
+    tmp=tempfile.mkdtemp(prefix="cse-bench-")
+    os.environ.update(CSE_CACHE_DIR=os.path.join(tmp,"cache"),CSE_DB="" if a.no_store else os.path.join(tmp,"tracker.db"),
+        CSE_STATE_FILE=os.path.join(tmp,"state.json"),CSE_FEED_DIR="",CSE_FETCH_MODE="api",GROQ_API_KEY="bench",GEMINI_API_KEY="bench",
+        CSE_RECENT_ROWS=str(a.recent_rows))
+    os.environ.pop("SERVICE_ACCOUNT_KEY",None)
+    sys.path.insert(0, os.path.join(HERE, ".."))
+    import cse_tracker_v9 as t
+    if not a.real_limits:
+        for l in t.LIMITS.values(): l.rate=l.burst=l.tokens=1e9
+    stub=Stub(a.cse_latency,a.llm_latency,a.llm_429); t.http=stub.http
+    samples=defaultdict(list)
+    def timed(name, fn):
+        def run(*args, **kw):
+            t0=time.perf_counter()
+            try: return fn(*args,**kw)
+            finally: samples[name].append(time.perf_counter()-t0)
+        return run
+    for name in STAGES: setattr(t,name,timed(name,getattr(t,name)))
+    anns=stub.anns["approvedAnnouncements"]
+    rows=seed_rows(size,t.SHEET_HEADERS,anns,broken=t.FIX_MAX_ROWS if scenario=="fix" else 0)
+    if a.recent_rows and size>a.recent_rows:  # already partitioned: older rows sit in archive tabs, their keys in the index
+        old=rows[1:-a.recent_rows]; del rows[1:-a.recent_rows]
+    else: old=[]
+    sheet=FakeWorksheet(rows,a.sheet_latency); book=FakeSpreadsheet(sheet)
+    if old:
+        book.tabs+=[FakeWorksheet([list(t.SHEET_HEADERS)]+old,a.sheet_latency,"Archive 2024-01",sheet.calls),
+                    FakeWorksheet([[t.SHEET_HEADERS[8]]]+[[r[8]] for r in old],a.sheet_latency,t.KEYS_TAB,sheet.calls)]
+    class FakeGM(t.GoogleManager):
+        def __init__(self, log_callback=None):
+            self.log=log_callback or print; self.worksheet=sheet; self.spreadsheet=book; self._tabs=None
+            self._rows=[]; self._cells=[]; self._wlock=threading.Lock(); self._last_flush=time.time()
+    FakeGM.flush=timed("sheet_flush",FakeGM.flush); t.GoogleManager=FakeGM
+    quiet=lambda m: None; out=io.StringIO(); t0=time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        if scenario=="pdf":
+            names=sorted(stub.pdfs); items=a.pdf_count
+            for i in range(items): t.download_pdf_text(f"upload_report_file/{i}_{names[i%len(names)]}",log=quiet)
+        elif scenario=="one_item":
+            gm=FakeGM(quiet); ek=gm.get_existing_keys(); items=len(anns)
+            for it in anns: t.process_one_item(gm,it,ek,log=quiet)
+            gm.flush()
+        elif scenario=="fix":
+            gm=FakeGM(quiet); items=t.FIX_MAX_ROWS; t.fix_old_summaries(gm,anns,log=quiet,state={})
+        else:
+            items=len(anns)+len(stub.fins["reqFinancialAnnouncemnets"]); t.run_headless(full=True)
+    secs=time.perf_counter()-t0
+    pct=lambda xs,q: sorted(xs)[min(len(xs)-1,int(q*len(xs)))]*1000
+    req=dict(stub.requests); req["sheets"]=sum(sheet.calls.values())
+    return {"size":size,"scenario":scenario,"items":items,"secs":secs,"per_sec":items/secs if secs else 0,
+            "rss_mb":resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,"requests":req,
+            "stages":{k:{"n":len(v),"p50":pct(v,.5),"p95":pct(v,.95)} for k,v in samples.items() if v}}
+
+# ─── PARENT ───────────────────────────────────────────────────────────
+def report(results, base=None):
+    prev={(r["size"],r["scenario"]):r for r in base or []}
+    print(f"{'sheet':>7} {'scenario':<10} {'items':>6} {'secs':>8} {'items/s':>9} {'rss MB':>7}  requests")
+    for r in results:
+        b=prev.get((r["size"],r["scenario"])); vs=f"  ({(r['secs']/b['secs']-1)*100:+.0f}% vs base)" if b and b["secs"] else ""
+        print(f"{r['size']:>7} {r['scenario']:<10} {r['items']:>6} {r['secs']:>8.2f} {r['per_sec']:>9.1f} {r['rss_mb']:>7.1f}  "
+              +" ".join(f"{k}={v}" for k,v in sorted(r["requests"].items()))+vs)
+        for k,s in r["stages"].items(): print(f"{'':>18} {k:<20} n={s['n']:<5} p50 {s['p50']:>8.1f} ms  p95 {s['p95']:>8.1f} ms")
+
+def main():
+    p=argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--sizes",default="1000,10000,50000",help="existing sheet rows, comma separated")
+    p.add_argument("--scenarios",default=",".join(SCENARIOS))
+    p.add_argument("--cse-latency",type=float,default=0.02,help="seconds per CSE/CDN request")
+    p.add_argument("--llm-latency",type=float,default=0.3,help="seconds per LLM request")
+    p.add_argument("--llm-429",type=float,default=0.0,help="fraction of LLM requests answered 429")
+    p.add_argument("--sheet-latency",type=float,default=0.05,help="seconds per worksheet call")
+    p.add_argument("--pdf-count",type=int,default=30,help="PDFs in the pdf scenario")
+    p.add_argument("--real-limits",action="store_true",help="keep RATE_LIMITS (default: unthrottled)")
+    p.add_argument("--no-store",action="store_true",help="run without the local SQLite store")
+    p.add_argument("--recent-rows",type=int,default=0,help="partitioned sheet: rows on the recent tab, the rest archived (default: one tab)")
+    p.add_argument("--save"); p.add_argument("--compare")
+    p.add_argument("--child",nargs=2,help=argparse.SUPPRESS)
+    a=p.parse_args()
+    if a.child: print(json.dumps(child(int(a.child[0]),a.child[1],a))); return
+    passthru=[x for x in sys.argv[1:] if x not in ("--save","--compare",a.save,a.compare)]
+    results=[]
+    for size in map(int,a.sizes.split(",")):
+        for sc in a.scenarios.split(","):
+            cp=subprocess.run([sys.executable,os.path.abspath(__file__),*passthru,"--child",str(size),sc],capture_output=True,text=True)
+            if cp.returncode: sys.exit(f"{sc} @ {size} failed:\n{cp.stderr}")
+            results.append(json.loads(cp.stdout.strip().splitlines()[-1]))
+    report(results,json.load(open(a.compare)) if a.compare else None)
+    if a.save:
+        with open(a.save,"w") as f: json.dump(results,f,indent=1)
+
+if __name__=="__main__":
+    main()
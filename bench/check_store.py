@@ -0,0 +1,41 @@
+"""
+Store check — rows another writer added to the sheet reach the local store, the JSON feed and search.
+
+A fake recent tab holds rows this process wrote plus one it never saw (another machine, a lost cache).
+After get_existing_keys() the store must carry that row's fields, write_feed() must publish it and
+search() must find it by a word of its summary. Prints what it checked; the exit code is 1 on a miss.
+
+Usage:
+  python bench/check_store.py
+"""
+import os, sys, json, time, tempfile, threading
+HERE=os.path.dirname(os.path.abspath(__file__))
+tmp=tempfile.mkdtemp(prefix="cse-check-")
+os.environ.update(CSE_CACHE_DIR=os.path.join(tmp,"cache"),CSE_DB=os.path.join(tmp,"tracker.db"),CSE_FEED_DIR=os.path.join(tmp,"feed"),
+    CSE_STATE_FILE=os.path.join(tmp,"state.json"))
+sys.path[:0]=[os.path.join(HERE,".."),HERE]
+import cse_tracker_v9 as t
+from bench_pipeline import FakeWorksheet, FakeSpreadsheet
+
+def row(i, co, summary):
+    ds=f"{i%28+1:02d} JAN 2025"; ts=f"{i%12+1:02d}:{i%60:02d}:00 AM"
+    return [ds,ts,co,"CASH DIVIDEND","",summary,"",0,f"{ds}|{ts}|{co}"]
+
+if __name__=="__main__":
+    quiet=lambda m: None
+    sheet=FakeWorksheet([list(t.SHEET_HEADERS)]); book=FakeSpreadsheet(sheet)
+    class FakeGM(t.GoogleManager):
+        def __init__(self, log_callback=None):
+            self.log=log_callback or print; self.worksheet=sheet; self.spreadsheet=book; self._tabs=None
+            self._rows=[]; self._cells=[]; self._wlock=threading.Lock(); self._last_flush=time.time()
+    gm=FakeGM(quiet); gm.get_existing_keys()
+    for i in range(41): t.write_rows(gm,[row(i,f"COMPANY {i} PLC",f"Company {i} declared a dividend of Rs. {i}.00 per share.")],i,log=quiet)
+    gm.flush(); t.write_feed(gm,log=quiet)  # an earlier run: the feed and the one-off sheet history import are done
+    sheet.rows.append(row(99,"OTHER WRITER PLC","Other Writer declared a zebra dividend of Rs. 9.00 per share."))
+    gm.get_existing_keys(); t.write_feed(gm,log=quiet)
+    feed=json.load(open(os.path.join(tmp,"feed","latest.json"))); hits=t.search("zebra")
+    checks={"store row has its fields":bool(t.STORE.q("SELECT 1 FROM rows WHERE company='OTHER WRITER PLC'")),
+            f"feed has every sheet row ({len(feed)}/{len(sheet.rows)-1})":len(feed)==len(sheet.rows)-1,
+            "search finds the sheet-only row":[h["company"] for h in hits]==["OTHER WRITER PLC"]}
+    for k,ok in checks.items(): print(f"{'✓' if ok else '✗'} {k}")
+    sys.exit(0 if all(checks.values()) else 1)
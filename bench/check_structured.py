@@ -0,0 +1,63 @@
+"""
+Golden check — structured summaries of the dTypes converted to Templates against the old builders.
+
+Cases: every combination of the fields the old builders read (empty company, missing/zero/float/string
+numbers, remarks with and without dates), plus every stored announcement detail of those dTypes in the
+local store (CSE_DB). Any output that differs is printed and the exit code is 1. Inputs the old builder
+raised on (e.g. int("1,000")) are counted, not compared.
+
+Usage:
+  python bench/check_structured.py
+"""
+import os, re, sys, json, sqlite3, itertools
+HERE=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+import cse_tracker_v9 as t
+
+def old_resignation(b, co, dtype):
+    role = "Chairperson" if "Chp" in dtype else "Director"
+    m = re.search(r'w\.?e\.?f\.?\s*(\d{1,2}[./]\d{1,2}[./]\d{4})', b.get("remarks","") or "")
+    return f"{co}: Resignation of {role}{f', effective {m.group(1)}' if m else ''}."
+
+def old_chairperson(b, co):
+    m = re.search(r'(?:w\.?e\.?f\.?|effective|from)\s*[:\s]*(\d{1,2}[./]\d{1,2}[./]\d{4}|\d{1,2}\s+\w+\s+\d{4})', b.get("remarks","") or "", re.IGNORECASE)
+    return f"{co}: Appointment of Chairperson{f', effective {m.group(1)}' if m else ''}."
+
+def old_rights(b, co):
+    parts = [f"{co} — Rights Issue."]
+    if b.get("numOfVotingShrsIssued"): parts.append(f"{int(b['numOfVotingShrsIssued']):,} voting shares.")
+    if b.get("votingShareConsideration"): parts.append(f"At Rs. {b['votingShareConsideration']}/- per share.")
+    if b.get("xr"): parts.append(f"XR: {b['xr']}.")
+    if b.get("remarks"): parts.append(b["remarks"])
+    return " ".join(parts)
+
+OLD = {"ResignationOfDirectors": lambda b,co: old_resignation(b,co,"ResignationOfDirectors"),
+       "ResignationOfChp": lambda b,co: old_resignation(b,co,"ResignationOfChp"),
+       "AppointOfChp": old_chairperson, "RightsIssue": old_rights}
+
+REMARKS = [None, "", "Resigned from the Board w.e.f 01.02.2025.", "w.e.f. 1/2/2025", "Effective 12 March 2025",
+    "Appointed as Chairperson from:  5\nJune 2025", "WEF 01.02.2025", "No date given", "effective 31.12.2024 and w.e.f 01.01.2025"]
+RIGHTS = dict(numOfVotingShrsIssued=[None,0,1000000,1000000.7,"1000000"], votingShareConsideration=[None,0,12.5,"12.50"],
+    xr=[None,"","12.03.2025"], remarks=[None,"","One new share for every 5 held."])
+
+def cases():
+    for dt in ("ResignationOfDirectors","ResignationOfChp","AppointOfChp"):
+        for co,rem in itertools.product(["","ABC PLC"],REMARKS): yield {"dType":dt,"companyName":co,"remarks":rem}
+    for co in ("","ABC PLC"):
+        for vals in itertools.product(*RIGHTS.values()): yield {"dType":"RightsIssue","companyName":co,**dict(zip(RIGHTS,vals))}
+    if t.DB_PATH and os.path.exists(t.DB_PATH):
+        for (d,) in sqlite3.connect(t.DB_PATH).execute("SELECT detail FROM announcements WHERE detail IS NOT NULL"):
+            try: b=json.loads(d).get("reqBaseAnnouncement") or {}
+            except (ValueError,AttributeError): continue
+            if b.get("dType") in OLD: yield b
+
+if __name__=="__main__":
+    n=same=raised=0
+    for b in cases():
+        try: want=OLD[b["dType"]](b,b.get("companyName",""))
+        except (ValueError,TypeError): raised+=1; continue
+        got=t.build_structured_summary({"reqBaseAnnouncement":b}); n+=1
+        if got==want: same+=1
+        else: print(f"✗ {b}\n    old: {want!r}\n    new: {got!r}")
+    print(f"{same}/{n} identical ({raised} input(s) the old builders raised on)")
+    sys.exit(0 if same==n else 1)
@@ -0,0 +1,110 @@
+"""
+Builds the offline fixtures used by bench/bench_pipeline.py.
+
+  python bench/fixtures/build.py           ← synthetic payloads in the CSE API's shape, PDFs from bench/corpus
+  python bench/fixtures/build.py --record  ← capture live approvedAnnouncement / getAnnouncementById /
+                                             getFinancialAnnouncement payloads and their PDFs instead
+"""
+import os, sys, json, glob, zlib, random
+from datetime import datetime, timedelta
+HERE=os.path.dirname(os.path.abspath(__file__)); CORPUS=os.path.join(HERE,"..","corpus"); PDF_DIR=os.path.join(HERE,"pdf")
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+def pdf(pages):
+    """Minimal PDF. Each page is a str (text layer, Helvetica) or None (an 8×8 grey image, as in a scan)."""
+    objs=["<< /Type /Catalog /Pages 2 0 R >>",None,"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]; kids=[]
+    for p in pages:
+        if p is None:
+            img=zlib.compress(bytes(range(0,256,4)))
+            objs.append(f"<< /Type /XObject /Subtype /Image /Width 8 /Height 8 /ColorSpace /DeviceGray /BitsPerComponent 8 "
+                        f"/Filter /FlateDecode /Length {len(img)} >>".encode()+b"\nstream\n"+img+b"\nendstream")
+            body=b"q 500 0 0 700 50 50 cm /Im0 Do Q"; res=f"/XObject << /Im0 {len(objs)} 0 R >>"
+        else:
+            esc=lambda l: l.replace("\\","\\\\").replace("(","\\(").replace(")","\\)")
+            body=("BT /F1 9 Tf 11 TL 40 800 Td "+" ".join(f"({esc(l)}) '" for l in p.splitlines()[:70])+" ET").encode("latin-1","replace")
+            res="/Font << /F1 3 0 R >>"
+        objs.append(f"<< /Length {len(body)} >>".encode()+b"\nstream\n"+body+b"\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << {res} >> /Contents {len(objs)} 0 R >>")
+        kids.append(len(objs))
+    objs[1]=f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+    out=bytearray(b"%PDF-1.4\n"); offs=[]
+    for i,o in enumerate(objs,1):
+        offs.append(len(out)); out+=f"{i} 0 obj\n".encode()+(o.encode() if isinstance(o,str) else o)+b"\nendobj\n"
+    x=len(out); out+=f"xref\n0 {len(objs)+1}\n0000000000 65535 f \n".encode()+"".join(f"{o:010d} 00000 n \n" for o in offs).encode()
+    out+=f"trailer\n<< /Size {len(objs)+1} /Root 1 0 R >>\nstartxref\n{x}\n%%EOF\n".encode()
+    return bytes(out)
+
+def synthetic():
+    r=random.Random(42); os.makedirs(PDF_DIR,exist_ok=True)
+    texts={os.path.splitext(os.path.basename(f))[0]:open(f,encoding="utf-8").read() for f in sorted(glob.glob(os.path.join(CORPUS,"*.txt")))}
+    for name,t in texts.items():
+        lines=t.splitlines(); pages=["\n".join(lines[i:i+60]) for i in range(0,len(lines),60)]
+        open(os.path.join(PDF_DIR,name+".pdf"),"wb").write(pdf(pages))
+    open(os.path.join(PDF_DIR,"scanned.pdf"),"wb").write(pdf([None,None]))
+    pdfs=sorted(texts)+["scanned"]
+    cos=["HAYLEYS FABRIC PLC","JOHN KEELLS HOLDINGS PLC","COMMERCIAL BANK OF CEYLON PLC","DIPPED PRODUCTS PLC","CEYLON COLD STORES PLC",
+         "SAMPATH BANK PLC","HATTON NATIONAL BANK PLC","ACCESS ENGINEERING PLC","AITKEN SPENCE PLC","LOLC HOLDINGS PLC"]
+    day=datetime(2025,3,14,8,30); anns=[]; details={}
+    for i in range(40):
+        aid=900000+i; co=cos[i%len(cos)]; cr=day+timedelta(minutes=7*i); kind=i%8
+        base={"companyName":co,"description":"","remarks":""}; docs=[]
+        if kind==0:
+            cat="CASH DIVIDEND"; base.update(dType="CashDividendWithDates",typeFirstInt=True,votingDivPerShare=round(r.uniform(0.5,5),2),
+                financialYear="2024/25",xd="26 MAR 2025",payment="04 APR 2025")
+        elif kind==1:
+            cat="DEALINGS BY DIRECTORS"; base.update(dType="DealingsByDirectors")
+        elif kind==2:
+            cat="GENERAL"; base.update(description="The Board of Directors approved the relocation of the registered office to "
+                f"No. {100+i}, Galle Road, with effect from 01 April 2025, and the opening of {i%5+2} new branches.")
+        else:
+            cat=["APPOINTMENTS","GENERAL","INTERIM FINANCIAL STATEMENTS","CASH DIVIDEND","OTHER"][kind-3]
+            name=pdfs[i%len(pdfs)]; docs=[{"fileUrl":f"upload_report_file/{aid}_{name}.pdf","baseUrl":"https://cdn.cse.lk/"}]
+            if i%13==0: docs.append({"fileUrl":f"upload_report_file/{aid}_annex_{name}.pdf","baseUrl":"https://cdn.cse.lk/"})
+        anns.append({"announcementId":aid,"company":co,"announcementCategory":cat,"dateOfAnnouncement":cr.strftime("%d %b %Y").upper(),
+                     "createdDate":int(cr.timestamp()*1000),"remarks":f"{cat.title()} — {co.title()}"})
+        details[str(aid)]={"reqBaseAnnouncement":base,"reqAnnouncementDocs":docs}
+    # Types with no dType builder, summarized by announcementCategory (BY_CATEGORY), with remarks that trip naive
+    # patterns: clock times next to ratios, share prices next to transaction values.
+    for j,(dt,cat,rem) in enumerate((
+            ("SubDivisionOfShares","SUB DIVISION OF SHARES","Sub-division of each existing ordinary share into 2 ordinary shares. "
+                "EGM at 10:30 a.m. on 28.03.2025, record date 12/03/2025."),
+            ("SubDivisionOfShares","SUB DIVISION OF SHARES","Sub-division in the proportion of 5 new shares for every 1 existing share. Record date 20.03.2025."),
+            ("SubDivisionOfShares","SUB DIVISION OF SHARES","Shareholders meeting at 10:30 a.m., record date 12/03/2025. Details to follow."),
+            ("ConsolidationOfShares","CONSOLIDATION OF SHARES","Consolidation of every 10 existing shares into 1 share, record date 20.03.2025."),
+            ("ScripDividend","SCRIP DIVIDEND","Scrip dividend of Rs. 2.00 per share satisfied by 1 share for every 25 shares held. "
+                "XD 20.03.2025. Board meeting at 2:30 p.m."),
+            ("CashDividend","CASH DIVIDEND","First interim dividend of Rs. 1.50 per share. XD 21.03.2025."),
+            ("RelatedPartyTransactions","RELATED PARTY TRANSACTIONS","Share price Rs. 12.50 as at date. "
+                "Aggregate value of the transaction Rs. 250,000,000 with a subsidiary."),
+            ("RelatedPartyTransactions","RELATED PARTY TRANSACTIONS","Market value per share Rs. 12.50. Transaction with a director."))):
+        aid=900100+j; co=cos[j%len(cos)]; cr=day+timedelta(minutes=7*len(anns))
+        anns.append({"announcementId":aid,"company":co,"announcementCategory":cat,"dateOfAnnouncement":cr.strftime("%d %b %Y").upper(),
+                     "createdDate":int(cr.timestamp()*1000),"remarks":f"{cat.title()} — {co.title()}"})
+        details[str(aid)]={"reqBaseAnnouncement":{"companyName":co,"dType":dt,"description":"","remarks":rem},"reqAnnouncementDocs":[]}
+    fins=[{"name":cos[i%len(cos)],"fileText":["Interim Financial Statements for the period ended 31.12.2024","Annual Report 2023/24"][i%2],
+           "path":f"upload_report_file/fin_{i}_interim_financials.pdf","uploadedDate":(day+timedelta(minutes=11*i)).strftime("%d %b %Y %I:%M %p")}
+          for i in range(20)]
+    return {"approvedAnnouncements":anns},{"reqFinancialAnnouncemnets":fins},details
+
+def record(n_details=40, n_pdfs=10):
+    import cse_tracker_v9 as t
+    post=lambda ep,timeout,**kw: t.http("POST","cse",t.CSE_API+ep,timeout,headers=t.FORM_HEADERS,**kw)
+    anns=post("approvedAnnouncement","list").json(); fins=post("getFinancialAnnouncement","list").json(); details={}
+    os.makedirs(PDF_DIR,exist_ok=True)
+    for it in anns.get("approvedAnnouncements",[])[:n_details]:
+        d=t.get_detail(it.get("announcementId"),it.get("announcementCategory",""))
+        if d: details[str(it["announcementId"])]=d
+    got=0
+    for d in details.values():
+        for doc in d.get("reqAnnouncementDocs",[]):
+            if got>=n_pdfs or not doc.get("fileUrl"): continue
+            content=t._fetch_pdf((t.CSE_CDN+doc["fileUrl"]).replace(' ','%20'),print)
+            if content: open(os.path.join(PDF_DIR,os.path.basename(doc["fileUrl"])),"wb").write(content); got+=1
+    return anns,fins,details
+
+if __name__=="__main__":
+    anns,fins,details=record() if "--record" in sys.argv else synthetic()
+    for name,obj in (("approvedAnnouncement",anns),("getFinancialAnnouncement",fins),("getAnnouncementById",details)):
+        with open(os.path.join(HERE,name+".json"),"w") as f: json.dump(obj,f,indent=1)
+    print(f"{len(anns.get('approvedAnnouncements',[]))} announcements, {len(details)} details, "
+          f"{len(fins.get('reqFinancialAnnouncemnets',[]))} financial reports, {len(os.listdir(PDF_DIR))} PDFs")
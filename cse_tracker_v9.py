@@ -10,19 +10,22 @@ Auto-detects:
 Usage:
   python cse_tracker_v9.py            ← GUI on Mac
   python cse_tracker_v9.py --headless ← force headless
+  python cse_tracker_v9.py --full     ← headless, ignore the saved watermark
+  python cse_tracker_v9.py --watch    ← keep running, poll CSE on an adaptive interval
+  python cse_tracker_v9.py --check    ← one request: exit 0 if nothing new since the last run, 1 otherwise
+  python cse_tracker_v9.py --coverage ← share of stored announcements summarized without PDF/LLM work
+  python cse_tracker_v9.py --backfill 2024-01-01 2024-06-30 --experimental  ← historical days, resumable
+  python cse_tracker_v9.py --search XR --category "rights issue" --company bank --from 2025 --to 2025
+                                      ← full-text search of stored summaries and PDF text
 """
 
-import time, os, sys, threading, webbrowser, requests, io, re, json
-from datetime import datetime, timedelta
-from collections import defaultdict
-import PyPDF2
-
-try:
-    from pdf2image import convert_from_bytes
-    import pytesseract
-    HAS_OCR = True
-except ImportError:
-    HAS_OCR = False
+import time, os, sys, threading, io, re, json, hashlib, signal, sqlite3, contextlib, string, atexit, queue
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit
+# requests, PyPDF2, pdf2image/pytesseract, gspread, pyarrow, tkinter and playwright are imported where first needed,
+# so a run that finds nothing new never loads them.
 
 # ─── CONFIGURATION ────────────────────────────────────────────────────
 
@@ -30,27 +33,364 @@ SERVICE_ACCOUNT_JSON = os.environ.get("SERVICE_ACCOUNT_JSON", "service_account.j
 SPREADSHEET_NAME = os.environ.get("SPREADSHEET_NAME", "CSE Disclosures Tracker")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
+CACHE_DIR = os.environ.get("CSE_CACHE_DIR", ".cse_cache")   # "" disables the on-disk cache
+CACHE_MAX_MB = int(os.environ.get("CSE_CACHE_MAX_MB", "500"))
+CACHE_BLOBS = os.environ.get("CSE_CACHE_BLOBS", "1") != "0"  # "0" keeps raw PDF bytes out of the cache (text/summaries still cached)
+DB_PATH = os.environ.get("CSE_DB", os.path.join(CACHE_DIR or ".", "tracker.db"))  # "" = Sheets-only, no local store
+STORE_RECONCILE_SECS = 6*3600  # how often the store re-reads the archive key index (the recent tab's keys are read every run)
+FEED_DIR = os.environ.get("CSE_FEED_DIR", "")  # static JSON feed for index.html, built from the store ("" = off)
+FEED_LATEST = 200          # rows in feed/latest.json
+STATE_FILE = os.environ.get("CSE_STATE_FILE", os.path.join(CACHE_DIR or ".", "state.json"))  # headless watermarks
+METRICS_FILE = os.environ.get("CSE_METRICS", "")       # JSON run report: span timings and counters
+METRICS_PROM = os.environ.get("CSE_METRICS_PROM", "")  # same, as a Prometheus textfile (both "" = metrics off)
+SINKS_SPEC = os.environ.get("CSE_SINKS", "")  # extra row outputs besides the sheet, e.g. "jsonl:out/rows.jsonl,parquet:out/rows,sqlite:out/rows.db"
+PARQUET_BATCH = 5000       # rows buffered by the parquet sink before files are written (it also writes at every flush)
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = "gemini-2.0-flash-lite"
+PROMPT_VERSION = 1         # bump when sys_msg/usr change, to invalidate memoized summaries
+SUMMARY_NEG_TTL = 3*86400  # seconds a known-bad summary is remembered
+LLM_BATCH_SIZE = 5         # disclosures packed into one LLM request; 1 = one request each
+LLM_BATCH_CHARS = 1500     # cleaned text per disclosure inside a batch request
+CIRCUIT_429S = 2           # consecutive 429s that take a provider out of rotation
+CIRCUIT_OPEN_SECS = 60     # ...for this long when it sends no Retry-After, doubling while 429s continue
+CIRCUIT_MAX_SECS = 900
+UPGRADE_MAX = 200          # rows written with a fallback while every provider was limited, kept for a later AI summary
+PDF_MAX_BYTES = 25*2**20   # PDFs larger than this are not downloaded
+PDF_MAX_PAGES = 15         # pages read for a text layer before giving up
+PDF_TEXT_CHARS = 3000      # stop reading pages once pre_clean() yields this much
+CLEAN_SCAN_CHARS = 12000   # pre_clean() looks at this much raw text; its output is capped at 3000
+OCR_PAGES = 3              # scanned PDFs: pages rasterized and OCR'd, one process each
+OCR_DPI = 200
+FETCH_MODE = os.environ.get("CSE_FETCH_MODE", "fallback")  # api | fallback (browser only if the API fails) | warm (API + reused browser)
 MAX_DISCLOSURES = 100
-SUMMARY_DELAY = 6
+FIX_MAX_ROWS = 40          # fix_old_summaries: rows repaired per run; a cursor in the run state resumes after them
+WATCH_MIN_SECS = 20        # --watch poll interval during CSE hours
+WATCH_IDLE_SECS = 300      # --watch poll interval outside CSE hours
+WATCH_MAX_SECS = 900       # back-off ceiling while nothing changes
+WATCH_FIX_SECS = 3600      # --watch: fix_old_summaries at most this often
+BACKFILL_WORKERS = 4       # --backfill: days processed at once, one worker process each
+BACKFILL_FORM = {"fromDate": "%Y-%m-%d", "toDate": "%Y-%m-%d"}  # --backfill: list-endpoint form fields for one day (strftime); unconfirmed, hence --experimental
+CSE_TZ = timezone(timedelta(hours=5, minutes=30))
+PIPELINE_WORKERS = 4       # announcements processed concurrently
+RATE_LIMITS = {            # service: (requests/sec, burst)
+    "cse": (4, 4), "cdn": (4, 4), "groq": (0.15, 2), "gemini": (0.25, 2)}
+WRITE_BATCH_SIZE = 50      # rows/cells buffered before a Sheets write
+WRITE_FLUSH_SECS = 30      # max age of a buffered write
+GUI_SCROLLBACK = 5000      # console lines the GUI keeps
+GUI_DRAIN_MS = 100         # GUI console/stats refresh interval
+RECENT_MAX_ROWS = int(os.environ.get("CSE_RECENT_ROWS", "5000"))  # rows kept on the first tab; older ones roll into archive tabs (0 = never)
+ROLL_BATCH = 500           # roll only once the first tab is this many rows over, so rows move in bulk
+ARCHIVE_TAB = "Archive %Y-%m"  # archive tab per row date (strftime); "Archive %Y" for yearly tabs
+KEYS_TAB = "Key Index"     # Unique Key of every archived row, so dedup never reads the archive tabs
 CSE_API = "https://www.cse.lk/api/"
 CSE_CDN = "https://cdn.cse.lk/"
+CSE_DISCLOSURES_PAGE = "https://www.cse.lk/pages/corporate-disclosures/corporate-disclosures.component.html"
 HTTP_HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
     'Referer': 'https://www.cse.lk/', 'Origin': 'https://www.cse.lk'}
+FORM_HEADERS = {**HTTP_HEADERS, 'Content-Type': 'application/x-www-form-urlencoded'}
+HTTP_RETRIES = 3           # urllib3 retries on 429/5xx, exponential backoff
+HTTP_BACKOFF = 0.5
+HTTP_TIMEOUTS = {"list": (5, 20), "detail": (5, 15), "pdf": (5, 20), "llm": (5, 25)}  # (connect, read)
+LLM_HOSTS = {"api.groq.com", "generativelanguage.googleapis.com"}  # 429s handled by ai_summarize
 SETUP_GUIDE = "\n  pip install gspread google-auth google-api-python-client PyPDF2 requests\n  No Chrome/Selenium needed!\n"
 
+# ─── CANCELLATION ─────────────────────────────────────────────────────
+class Cancelled(BaseException):
+    """Raised out of sleeps and requests once CANCEL is set. A BaseException, so the pipeline's
+    `except Exception` handlers let it through to the top of the run."""
+
+CANCEL = threading.Event()  # set by the GUI's Stop
+INTERRUPTIBLE = False       # run requests on a helper thread a Stop can abandon (the GUI turns this on)
+
+def pause(secs):
+    """time.sleep that raises Cancelled as soon as CANCEL is set."""
+    if CANCEL.wait(secs): raise Cancelled()
+
+def interruptible(fn, *args, **kw):
+    """fn(*args, **kw), raising Cancelled once CANCEL is set. With INTERRUPTIBLE the call runs on a helper
+    thread that is abandoned on cancel; it ends on its own timeout and its result is dropped."""
+    if CANCEL.is_set(): raise Cancelled()
+    if not INTERRUPTIBLE: return fn(*args,**kw)
+    box={}; done=threading.Event()
+    def run():
+        try: box["r"]=fn(*args,**kw)
+        except BaseException as e: box["e"]=e
+        finally: done.set()
+    threading.Thread(target=run,daemon=True).start()
+    while not done.wait(0.1):
+        if CANCEL.is_set(): raise Cancelled()
+    if "e" in box: raise box["e"]
+    return box["r"]
+
+# ─── RATE LIMITING ────────────────────────────────────────────────────
+class RateLimiter:
+    """Token bucket: `rate` tokens/sec, up to `burst` banked. acquire() blocks until one is free."""
+    def __init__(self, rate, burst=1):
+        self.rate=rate; self.burst=burst; self.tokens=float(burst); self.t=time.monotonic(); self.lock=threading.Lock()
+    def acquire(self):
+        while True:
+            with self.lock:
+                now=time.monotonic(); self.tokens=min(self.burst,self.tokens+(now-self.t)*self.rate); self.t=now
+                if self.tokens>=1: self.tokens-=1; return
+                wait=(1-self.tokens)/self.rate
+            pause(wait)
+
+LIMITS = {k: RateLimiter(*v) for k,v in RATE_LIMITS.items()}
+
+# ─── METRICS ──────────────────────────────────────────────────────────
+def _pct(xs, q): xs=sorted(xs); return xs[min(len(xs)-1,int(q*len(xs)))] if xs else 0
+
+def _write_atomic(path, text):
+    d=os.path.dirname(path)
+    if d: os.makedirs(d,exist_ok=True)
+    with open(path+".tmp","w") as f: f.write(text)
+    os.replace(path+".tmp",path)
+
+class _Timings:
+    """One span key: count/sum/max, cumulative histogram buckets and the last SAMPLE timings for p50/p95."""
+    SAMPLE = 1000
+    __slots__ = ("count","total","max","buckets","recent")
+    def __init__(self, n): self.count=0; self.total=0.0; self.max=0.0; self.buckets=[0]*n; self.recent=deque(maxlen=self.SAMPLE)
+    def add(self, secs, bounds):
+        self.count+=1; self.total+=secs; self.max=max(self.max,secs); self.recent.append(secs)
+        for i,b in enumerate(bounds):
+            if secs<=b: self.buckets[i]+=1
+
+class Metrics:
+    """Counters and span timings keyed by name + labels. `with METRICS.span("detail"):` times a block,
+    METRICS.inc("http_requests", service="cse") counts. write() emits the JSON report and Prometheus text.
+    Memory per span key is fixed (buckets + a bounded sample), so --watch can run indefinitely."""
+    BUCKETS = (.01,.05,.1,.25,.5,1,2.5,5,10,30,60,120)
+    def __init__(self):
+        self.lock=threading.Lock(); self.counters=defaultdict(float); self.times={}; self.gauges={}; self.t0=time.time()
+    def inc(self, name, n=1, **labels):
+        k=(name,tuple(sorted(labels.items())))
+        with self.lock: self.counters[k]+=n
+    def observe(self, name, secs, **labels):
+        k=(name,tuple(sorted(labels.items())))
+        with self.lock:
+            t=self.times.get(k)
+            if t is None: t=self.times[k]=_Timings(len(self.BUCKETS))
+            t.add(secs,self.BUCKETS)
+    def gauge(self, name, value, **labels):
+        with self.lock: self.gauges[(name,tuple(sorted(labels.items())))]=value
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        t=time.perf_counter()
+        try: yield
+        finally: self.observe(name,time.perf_counter()-t,**labels)
+    def report(self):
+        key=lambda k: k[0]+("{"+",".join(f"{a}={b}" for a,b in k[1])+"}" if k[1] else "")
+        with self.lock:
+            return {"started":datetime.fromtimestamp(self.t0,timezone.utc).isoformat(timespec="seconds"),"secs":round(time.time()-self.t0,3),
+                "spans":{key(k):{"count":v.count,"total":round(v.total,3),"p50":round(_pct(v.recent,.5),4),"p95":round(_pct(v.recent,.95),4),"max":round(v.max,4)}
+                         for k,v in sorted(self.times.items())},
+                "counters":{key(k):v for k,v in sorted(self.counters.items())},"gauges":{key(k):v for k,v in sorted(self.gauges.items())}}
+    def prom(self):
+        esc=lambda v: str(v).replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")
+        lbl=lambda ls,**more: "{"+",".join(f'{a}="{esc(b)}"' for a,b in (*ls,*more.items()))+"}" if ls or more else ""
+        out=[]; typed=set()
+        with self.lock:
+            for (name,ls),v in sorted(self.counters.items()):
+                if name not in typed: typed.add(name); out.append(f"# TYPE cse_{name}_total counter")
+                out.append(f"cse_{name}_total{lbl(ls)} {v:g}")
+            for (name,ls),v in sorted(self.times.items()):
+                if name not in typed: typed.add(name); out.append(f"# TYPE cse_{name}_seconds histogram")
+                for b,c in zip(self.BUCKETS,v.buckets): out.append(f"cse_{name}_seconds_bucket{lbl(ls,le=b)} {c}")
+                out+=[f"cse_{name}_seconds_bucket{lbl(ls,le='+Inf')} {v.count}",f"cse_{name}_seconds_sum{lbl(ls)} {v.total:.6f}",f"cse_{name}_seconds_count{lbl(ls)} {v.count}"]
+            for (name,ls),v in sorted(self.gauges.items()):
+                if name not in typed: typed.add(name); out.append(f"# TYPE cse_{name} gauge")
+                out.append(f"cse_{name}{lbl(ls)} {v:g}")
+        out+=["# TYPE cse_run_seconds gauge",f"cse_run_seconds {time.time()-self.t0:.3f}"]
+        return "\n".join(out)+"\n"
+    def write(self, path=METRICS_FILE, prom=METRICS_PROM):
+        try:
+            if path: _write_atomic(path,json.dumps(self.report(),indent=1))
+            if prom: _write_atomic(prom,self.prom())
+        except OSError as e: print(f"✗ Metrics not written: {e}")
+
+class NullMetrics:
+    """Metrics off: every call is a no-op."""
+    _NULL = contextlib.nullcontext()
+    def inc(self, *a, **kw): pass
+    def observe(self, *a, **kw): pass
+    def gauge(self, *a, **kw): pass
+    def span(self, *a, **kw): return self._NULL
+    def write(self, *a, **kw): pass
+
+METRICS = Metrics() if METRICS_FILE or METRICS_PROM else NullMetrics()
+
+# ─── HTTP CLIENT ──────────────────────────────────────────────────────
+_SESSIONS = {}; _SESSIONS_LOCK = threading.Lock()
+
+def http_session(url):
+    """Shared keep-alive Session for the URL's host, with retry/backoff on 429 and 5xx."""
+    host=urlsplit(url).netloc
+    with _SESSIONS_LOCK:
+        s=_SESSIONS.get(host)
+        if s is None:
+            import requests; from requests.adapters import HTTPAdapter; from urllib3.util.retry import Retry
+            st=(500,502,503,504) if host in LLM_HOSTS else (429,500,502,503,504)
+            ad=HTTPAdapter(pool_connections=1,pool_maxsize=PIPELINE_WORKERS*2,max_retries=Retry(total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF,status_forcelist=st,allowed_methods=None,raise_on_status=False))
+            s=_SESSIONS[host]=requests.Session(); s.mount("https://",ad); s.mount("http://",ad)
+        return s
+
+def http(method, service, url, timeout, **kw):
+    with METRICS.span("rate_limit_wait",service=service): LIMITS[service].acquire()
+    try:
+        with METRICS.span("http",service=service): r=interruptible(http_session(url).request,method,url,timeout=HTTP_TIMEOUTS[timeout],**kw)
+    except Exception: METRICS.inc("http_requests",service=service,status="error"); raise
+    METRICS.inc("http_requests",service=service,status=r.status_code); return r
+
+# ─── DISK CACHE ───────────────────────────────────────────────────────
+class DiskCache:
+    """Size-bounded LRU file cache. Entries live at <root>/<kind>/<sha1(key)>; mtime is the LRU clock."""
+    def __init__(self, root, max_bytes):
+        self.root=root; self.max_bytes=max_bytes; self.size=None; self.lock=threading.Lock()
+    def _path(self, kind, key):
+        h=hashlib.sha1(str(key).encode()).hexdigest(); return os.path.join(self.root,kind,h[:2],h)
+    def get(self, kind, key):
+        p=self._path(kind,key)
+        try:
+            with open(p,'rb') as f: data=f.read()
+            os.utime(p); return data
+        except OSError: return None
+    def put(self, kind, key, data):
+        p=self._path(kind,key)
+        try: old=os.path.getsize(p)  # overwriting an entry replaces its bytes, it doesn't add to them
+        except OSError: old=0
+        try:
+            os.makedirs(os.path.dirname(p),exist_ok=True); tmp=f"{p}.{threading.get_ident()}.tmp"
+            with open(tmp,'wb') as f: f.write(data)
+            os.replace(tmp,p)
+        except OSError: return
+        with self.lock:
+            if self.size is None: self.size=sum(sz for _,sz,_ in self._entries())
+            else: self.size+=len(data)-old
+            if self.size>self.max_bytes: self._evict()
+    def get_json(self, kind, key):
+        d=self.get(kind,key)
+        try: return json.loads(d) if d is not None else None
+        except ValueError: return None
+    def put_json(self, kind, key, obj): self.put(kind,key,json.dumps(obj).encode())
+    def _entries(self):
+        for d,_,files in os.walk(self.root):
+            if d==self.root: continue  # top-level files (state.json) are not cache entries
+            for fn in files:
+                p=os.path.join(d,fn)
+                try: st=os.stat(p); yield p,st.st_size,st.st_mtime
+                except OSError: pass
+    def _evict(self):
+        ents=sorted(self._entries(),key=lambda e:e[2]); self.size=sum(e[1] for e in ents)
+        for p,sz,_ in ents:
+            if self.size<=self.max_bytes*0.9: break
+            try: os.remove(p); self.size-=sz
+            except OSError: pass
+
+CACHE = DiskCache(CACHE_DIR, CACHE_MAX_MB*2**20) if CACHE_DIR else None
+
 # ─── STRUCTURED SUMMARIES ────────────────────────────────────────────
-def build_structured_summary(ann_data):
-    base = ann_data.get("reqBaseAnnouncement", {}); dtype = base.get("dType", ""); company = base.get("companyName", "")
-    if dtype == "CashDividendWithDates": return _build_dividend(base, company)
-    elif dtype == "DealingsByDirectors": return _build_dealings(base, company)
-    elif dtype == "AppointmentOfDirectors": return _build_appointment(base, company)
-    elif dtype in ("ResignationOfDirectors", "ResignationOfChp"): return _build_resignation(base, company, dtype)
-    elif dtype in ("AppointOfChp",): return _build_chairperson(base, company)
-    elif dtype == "RightsIssue": return _build_rights(base, company)
-    elif dtype == "ExtraOrdinaryGeneralMeetingInitial": return _build_egm(base, company)
-    elif dtype in ("AgmInitial",): return _build_agm(base, company)
-    return None
+# dType → builder(base, company). Functions register with @structured(...); simple types are Templates.
+# Announcements whose dType has no builder fall back to BY_CATEGORY, matched on the list's announcementCategory.
+STRUCTURED = {}
+
+def structured(*dtypes):
+    def reg(fn):
+        for d in dtypes: STRUCTURED[d]=fn
+        return fn
+    return reg
+
+def build_structured_summary(ann_data, category=""):
+    base = ann_data.get("reqBaseAnnouncement", {}); fn = STRUCTURED.get(base.get("dType", "")) or category_template(category)
+    return fn(base, base.get("companyName", "")) if fn else None
+
+_FIELD = re.compile(r'\{(\w+)')
+_DATE = r'(\d{1,2}[./-]\d{1,2}[./-]\d{4}|\d{1,2}(?:st|nd|rd|th)?\s+[A-Za-z]+,?\s+\d{4})'
+_WEF_DATE = re.compile(r'w\.?e\.?f\.?\s*(\d{1,2}[./]\d{1,2}[./]\d{4})')
+_EFFECTIVE_DATE = re.compile(r'(?:w\.?e\.?f\.?|effective|from)\s*[:\s]*(\d{1,2}[./]\d{1,2}[./]\d{4}|\d{1,2}\s+\w+\s+\d{4})', re.IGNORECASE)
+_RECORD_DATE = re.compile(r'(?:record\s+date|entitlement\s+date|\bXD\b|ex[- ]?dividend\s+date)[^0-9]{0,20}'+_DATE, re.IGNORECASE)
+# "1 new share for every 25" or "ratio of 1:5"; a bare n:n is never taken, it is usually a clock time
+_RATIO = re.compile(r'(?<![\d:.])(\d+(?:\.\d+)?\s+(?:\(\d+\)\s+)?(?:[A-Za-z]+\s+){0,3}?for\s+(?:every\s+)?(?:\(\d+\)\s+)?\d+(?:\.\d+)?)(?![\d:])'
+    r'|ratio\s+(?:of\s+)?(\d+\s*:\s*\d+)(?![\d:])(?!\s*[ap]\.?\s*m\b)', re.IGNORECASE)
+_INTO = re.compile(r'\b((?:each|every\s+\d+)\s+(?:[A-Za-z()\d]+\s+){0,4}?into\s+\d+(?:\s+(?:new\s+|ordinary\s+|voting\s+)*shares?)?)', re.IGNORECASE)
+_PER_SHARE = re.compile(r'(Rs\.?\s*\d+(?:\.\d+)?)\s*(?:/-\s*)?per\s+(?:ordinary\s+|voting\s+)?share', re.IGNORECASE)
+# Only an amount introduced as the transaction's value/consideration, never a per-share price
+_RPT_VALUE = re.compile(r'\b(?:value|consideration)\b(?!\s+per\b)[^.;]{0,40}?(Rs\.?\s*[\d,]+(?:\.\d+)?(?:\s*(?:Mn|Million|Bn|Billion)\b)?)'
+    r'(?!\s*(?:/-\s*)?per\s+share)', re.IGNORECASE)
+
+class _Fmt(string.Formatter):
+    """Format specs such as {n:,d} also accept the numeric strings the CSE API sometimes sends; a d spec
+    truncates like int() did in the old builders."""
+    def format_field(self, v, spec):
+        if spec:
+            try: v=float(str(v).replace(",","")); v=int(v) if spec.endswith("d") or v==int(v) else v
+            except ValueError: spec=""
+        return format(v,spec)
+
+_FMT = _Fmt()
+
+class Template:
+    """Declarative summary. `parts` are format strings over the base announcement's fields and {co}, joined
+    as-is; a part naming an empty value other than {co} is dropped. `extract` maps a name to a compiled regex (or (regex,
+    field)) whose first matching group is taken from the field, default remarks + description. No summary unless every
+    `require` entry (a name, or a tuple of alternatives) has a value."""
+    def __init__(self, *parts, extract=None, require=()):
+        self.parts=[(p,_FIELD.findall(p)) for p in parts]; self.extract=extract or {}; self.require=require
+    def __call__(self, b, co):
+        v=dict(b); v["co"]=co; text=f"{b.get('remarks') or ''} {b.get('description') or ''}"
+        for name,rx in self.extract.items():
+            rx,field=rx if isinstance(rx,tuple) else (rx,None)
+            m=rx.search(b.get(field) or "" if field else text); v[name]=next(g for g in m.groups() if g) if m else ""
+        if not all(any(v.get(n) for n in ((r,) if isinstance(r,str) else r)) for r in self.require): return None
+        return "".join(_FMT.format(p,**v) for p,names in self.parts if all(v.get(n) for n in names if n!="co")) or None
+
+STRUCTURED.update({
+    "ResignationOfDirectors": Template("{co}: Resignation of Director",", effective {eff}",".",extract={"eff":(_WEF_DATE,"remarks")}),
+    "ResignationOfChp": Template("{co}: Resignation of Chairperson",", effective {eff}",".",extract={"eff":(_WEF_DATE,"remarks")}),
+    "AppointOfChp": Template("{co}: Appointment of Chairperson",", effective {eff}",".",extract={"eff":(_EFFECTIVE_DATE,"remarks")}),
+    "RightsIssue": Template("{co} — Rights Issue."," {numOfVotingShrsIssued:,d} voting shares."," At Rs. {votingShareConsideration}/- per share.",
+        " XR: {xr}."," {remarks}"),
+})
+
+# By announcementCategory (its words, as FEED_GROUPS and index.html match them), first match wins; used only
+# when the dType has no builder. Each returns None without its key value, leaving the item to the PDF/LLM path.
+BY_CATEGORY = [
+    (lambda s: "SPLIT" in s or "SUB DIVISION" in s or "SUB-DIVISION" in s or "SUBDIVISION" in s,
+        Template("{co}: Sub-division of shares"," in the ratio {ratio}"," ({into})",", record date {rec}",".",
+            extract={"ratio":_RATIO,"into":_INTO,"rec":_RECORD_DATE},require=(("ratio","into"),))),
+    (lambda s: "CONSOLIDATION" in s, Template("{co}: Consolidation of shares"," in the ratio {ratio}"," ({into})",", record date {rec}",".",
+        extract={"ratio":_RATIO,"into":_INTO,"rec":_RECORD_DATE},require=(("ratio","into"),))),
+    (lambda s: "SCRIP DIVIDEND" in s, Template("{co} declared a scrip dividend"," of {ps} per share"," ({ratio})",", XD {rec}",".",
+        extract={"ps":_PER_SHARE,"ratio":_RATIO,"rec":_RECORD_DATE},require=(("ps","ratio"),))),
+    (lambda s: "CASH DIVIDEND" in s, Template("{co} declared a cash dividend"," of {ps} per share",", XD {rec}",".",
+        extract={"ps":_PER_SHARE,"rec":_RECORD_DATE},require=("ps",))),
+    (lambda s: "RELATED PARTY" in s, Template("{co}: Related party transaction"," of {amt}",".",extract={"amt":_RPT_VALUE},require=("amt",))),
+]
+
+def category_template(category):
+    s=(category or "").upper()
+    return next((tpl for m,tpl in BY_CATEGORY if m(s)),None)
+
+def structured_coverage(log=print):
+    """Share of stored announcements build_structured_summary resolves (no PDF, no LLM), by dType; the handler
+    column says whether a dType builder or a BY_CATEGORY template (for some of its items) covers it."""
+    if not STORE: log("✗ Coverage needs the local store (CSE_DB)"); return
+    by=defaultdict(lambda:[0,0,False])
+    for d,cat in STORE.q("SELECT detail,category FROM announcements WHERE detail IS NOT NULL"):
+        try: det=json.loads(d); dt=(det.get("reqBaseAnnouncement") or {}).get("dType") or "(none)"
+        except (ValueError,AttributeError): continue
+        by[dt][0]+=1; by[dt][2]|=category_template(cat) is not None
+        try: by[dt][1]+=bool(build_structured_summary(det,cat))
+        except Exception: pass
+    tot=sum(n for n,_,_ in by.values()); ok=sum(r for _,r,_ in by.values())
+    if not tot: log("  No stored announcement details yet"); return
+    log(f"Structured: {ok}/{tot} ({ok/tot:.0%}) resolved without PDF or LLM work")
+    log(f"  {'dType':<40} {'items':>6} {'resolved':>9}  handler")
+    for dt,(n,r,bycat) in sorted(by.items(),key=lambda kv:-kv[1][0]):
+        log(f"  {dt:<40} {n:>6} {r:>9}  {'dType' if dt in STRUCTURED else 'category' if bycat else '-'}")
 
+@structured("CashDividendWithDates")
 def _build_dividend(b, co):
     dt = []
     if b.get("firstAndFinal"): dt.append("first & final")
@@ -76,6 +416,7 @@ def _build_dividend(b, co):
     if d: s += " " + ", ".join(d) + "."
     return s
 
+@structured("DealingsByDirectors")
 def _build_dealings(b, co):
     nature = b.get("natureOfDir",""); txns = b.get("directorTransactions",[])
     if "refer attachment" in nature.lower() or "refer attachment" in (b.get("relInterestAccountName","") or "").lower(): return None
@@ -98,6 +439,7 @@ def _build_dealings(b, co):
         parts.append(f"{tt}: {qs} shares {prs} on {dts}.".strip())
     return " ".join(parts)
 
+@structured("AppointmentOfDirectors")
 def _build_appointment(b, co):
     dirs = b.get("dirList",[])
     if not dirs: return None
@@ -109,23 +451,7 @@ def _build_appointment(b, co):
         if d.get("numberOfShares",0): parts.append(f"Holds {int(d['numberOfShares']):,} shares.")
     return " ".join(parts)
 
-def _build_resignation(b, co, dtype):
-    role = "Chairperson" if "Chp" in dtype else "Director"
-    m = re.search(r'w\.?e\.?f\.?\s*(\d{1,2}[./]\d{1,2}[./]\d{4})', b.get("remarks","") or "")
-    return f"{co}: Resignation of {role}{f', effective {m.group(1)}' if m else ''}."
-
-def _build_chairperson(b, co):
-    m = re.search(r'(?:w\.?e\.?f\.?|effective|from)\s*[:\s]*(\d{1,2}[./]\d{1,2}[./]\d{4}|\d{1,2}\s+\w+\s+\d{4})', b.get("remarks","") or "", re.IGNORECASE)
-    return f"{co}: Appointment of Chairperson{f', effective {m.group(1)}' if m else ''}."
-
-def _build_rights(b, co):
-    parts = [f"{co} — Rights Issue."]
-    if b.get("numOfVotingShrsIssued"): parts.append(f"{int(b['numOfVotingShrsIssued']):,} voting shares.")
-    if b.get("votingShareConsideration"): parts.append(f"At Rs. {b['votingShareConsideration']}/- per share.")
-    if b.get("xr"): parts.append(f"XR: {b['xr']}.")
-    if b.get("remarks"): parts.append(b["remarks"])
-    return " ".join(parts)
-
+@structured("ExtraOrdinaryGeneralMeetingInitial")
 def _build_egm(b, co):
     parts = [f"{co} — EGM scheduled for {b.get('dateOfEgm','')}"]
     if b.get("time"): parts.append(f"at {b['time']}")
@@ -136,6 +462,7 @@ def _build_egm(b, co):
         s += f" Resolutions: {res_clean}."
     return s
 
+@structured("AgmInitial")
 def _build_agm(b, co):
     agm = b.get("agm","") or b.get("dateOfAgm","")
     s = f"{co} — AGM" + (f" scheduled for {agm}" if agm else "") + "."
@@ -145,194 +472,692 @@ def _build_agm(b, co):
 # ─── AI SUMMARIZATION ────────────────────────────────────────────────
 JUNK = ['dear madam','dear sir','yours faithfully','yours sincerely','chief regulatory officer',
     'west block','echelon square','world trade centre','p w corporate','heed oltrce','tel:','fax:']
+NOT_GOOD = JUNK+['key details were not provided','unfortunately','does not contain sufficient','not enough information',
+    'cannot extract specific','the provided text does not','the given text','here are the specific facts','nilupa perera']
+FALLBACK = ['i don\'t see','unfortunately','does not contain','not enough information','cannot extract',
+    'the provided text','key details were not provided','here are the specific facts','nilupa perera','company registration number']
+
+# Everything from the first sign-off on is dropped; the rest are replaced by a space, in one pass.
+_SIGNOFF = re.compile(r'Yours\s+(?:faithfully|sincerely|truly)|BY\s+ORDER\s+OF\s+THE\s+BOARD|For\s+and\s+on\s+behalf\s+of',re.I)
+_BOILERPLATE = re.compile('|'.join([r'Dear\s+(?:Sir|Madam|Madan-?r?|Sirs?)[\s,]*',r'Mr?s\.?\s+Nilupa\s+Perar?a.{0,100}',
+    r'Chief\s+Regulatory\s+Officer.{0,100}',r'Colombo\s+Stock\s+Exc[a-z]*.{0,100}',r'Echelon\s+Square.{0,60}',
+    r'World\s*\'?[Tt]rade\s+Centr?e.{0,60}',r'West\s+Block.{0,60}',
+    r'#?\d+[-/]?\d*,?\s*\w+\s+(?:Road|Street|Lane|Mawatha|Place).{0,80}',r'Colombo\s*\d{1,2}.{0,40}',r'Sri\s+Lanka\.?',
+    r'Tel(?:ephone)?:?\s*[\+\d\s\-\(\)\']{5,30}',r'Fax:?\s*[\+\d\s\-\(\)\']{5,30}',r'E-?mail:?\s*\S+@\S+',
+    r'P\s*W\s*(?:Corporate|Gorporate)\s*Secretarial.{0,80}',r'M&S\s*Managers\s*&\s*Secretaries.{0,80}',
+    r'JACEY\s*&?\s*(?:COMPANY|GOMPANY).{0,80}',r'JULIUS\s*&?\s*CREASY.{0,80}']),re.I)
+_STRAY = re.compile(r'[{}\[\]|\\@#$^~`]'); _DOTS = re.compile(r'[!.]{2,}'); _WS = re.compile(r'\s+')
+
+def _phrases(ps):
+    """One compiled alternation over literal phrases: a single scan instead of one `in` per phrase."""
+    return re.compile('|'.join(map(re.escape,sorted(set(ps),key=len,reverse=True)))).search
+
+_not_good = _phrases(NOT_GOOD); _fallback = _phrases(FALLBACK)
 
 def pre_clean(t):
+    """Letter boilerplate out, whitespace collapsed, at most 3000 chars. Only the first CLEAN_SCAN_CHARS are read."""
     if not t: return ""
-    for p in [r'Yours\s+(faithfully|sincerely|truly).*',r'BY\s+ORDER\s+OF\s+THE\s+BOARD.*',r'For\s+and\s+on\s+behalf\s+of.*']:
-        t = re.sub(p,'',t,flags=re.IGNORECASE|re.DOTALL)
-    for p in [r'Dear\s+(Sir|Madam|Madan-?r?|Sirs?)[\s,]*',r'Ms\.?\s+Nilupa\s+Perar?a.{0,100}',r'Mrs\.?\s+Nilupa\s+Perar?a.{0,100}',
-        r'Chief\s+Regulatory\s+Officer.{0,100}',r'Colombo\s+Stock\s+Exc[a-z]*.{0,100}',r'Echelon\s+Square.{0,60}',
-        r'World\s*\'?[Tt]rade\s+Centr?e.{0,60}',r'West\s+Block.{0,60}',
-        r'#?\d+[-/]?\d*,?\s*\w+\s+(Road|Street|Lane|Mawatha|Place).{0,80}',r'Colombo\s*\d{1,2}.{0,40}',r'Sri\s+Lanka\.?',
-        r'Tel(?:ephone)?:?\s*[\+\d\s\-\(\)\']{5,30}',r'Fax:?\s*[\+\d\s\-\(\)\']{5,30}',r'E-?mail:?\s*\S+@\S+',
-        r'P\s*W\s*(?:Corporate|Gorporate)\s*Secretarial.{0,80}',r'M&S\s*Managers\s*&\s*Secretaries.{0,80}',
-        r'JACEY\s*&?\s*(?:COMPANY|GOMPANY).{0,80}',r'JULIUS\s*&?\s*CREASY.{0,80}']:
-        t = re.sub(p,' ',t,flags=re.IGNORECASE)
-    return re.sub(r'\s+',' ',re.sub(r'[!.]{2,}','.',re.sub(r'[{}\[\]|\\@#$^~`]','',t))).strip()[:3000]
+    t=t[:CLEAN_SCAN_CHARS]; m=_SIGNOFF.search(t)
+    if m: t=t[:m.start()]
+    return _WS.sub(' ',_DOTS.sub('.',_STRAY.sub('',_BOILERPLATE.sub(' ',t)))).strip()[:3000]
 
 def is_good(s):
     if not s or len(s)<20 or len(s)>800 or len(s.split())<5: return False
-    sl=s.lower()
-    for p in JUNK:
-        if p in sl: return False
-    for l in ['key details were not provided','unfortunately','does not contain sufficient','not enough information',
-              'cannot extract specific','the provided text does not','the given text','here are the specific facts','nilupa perera']:
-        if l in sl: return False
-    return True
-
-def is_fallback(s):
-    if not s: return True
-    sl=s.lower()
-    for b in ['i don\'t see','unfortunately','does not contain','not enough information','cannot extract',
-              'the provided text','key details were not provided','here are the specific facts','nilupa perera','company registration number']:
-        if b in sl: return True
-    return False
+    return not _not_good(s.lower())
 
-def ai_summarize(raw, company="", subject="", log=print):
-    if not raw or len(raw)<30: return None
+def is_fallback(s, company="", subject=""):
+    """Empty, an LLM non-answer, or (given the row's company and category) the bare "{co} — {cat}." placeholder."""
+    return not s or bool(_fallback(s.lower())) or (bool(company) and s==f"{company} — {subject}.")
+
+# ─── LLM PROVIDERS ────────────────────────────────────────────────────
+_DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+def _secs(v):
+    """Retry-After / x-ratelimit-reset values ("7", "7.66s", "2m59.5s", "350ms") in seconds, or None."""
+    if not v: return None
+    try: return float(v)
+    except ValueError: pass
+    parts=_DURATION.findall(str(v))
+    return sum(float(n)*{"ms":.001,"s":1,"m":60,"h":3600}[u] for n,u in parts) if parts else None
+
+class Provider:
+    """Circuit breaker for one LLM provider, fed every response. A Retry-After (or Gemini's retryDelay), or
+    CIRCUIT_429S 429s in a row, take it out of rotation; so does x-ratelimit-remaining-requests hitting 0,
+    until the advertised reset. While it is out, callers skip it instead of sleeping."""
+    def __init__(self, name):
+        self.name=name; self.lock=threading.Lock(); self.streak=0; self.until=0.0; self.remaining=None
+    def ready(self): return time.time()>=self.until
+    def record(self, r):
+        """Update from a response; returns the seconds the provider is now out of rotation for, or None."""
+        h=r.headers or {}; wait=None
+        with self.lock:
+            try: self.remaining=int(h["x-ratelimit-remaining-requests"])
+            except (KeyError,ValueError): pass
+            if r.status_code==429:
+                self.streak+=1; m=re.search(rb'"retryDelay":\s*"([\d.]+)s"',r.content or b"")
+                wait=_secs(h.get("retry-after")) or (float(m.group(1)) if m else None)
+                if not wait and self.streak>=CIRCUIT_429S: wait=min(CIRCUIT_OPEN_SECS*2**(self.streak-CIRCUIT_429S),CIRCUIT_MAX_SECS)
+            else:
+                self.streak=0
+                if self.remaining==0: wait=_secs(h.get("x-ratelimit-reset-requests"))
+            if wait: self.until=max(self.until,time.time()+wait)
+        if wait: METRICS.inc("circuit_open",provider=self.name)
+        return wait
+
+PROVIDERS = {"groq": Provider("groq"), "gemini": Provider("gemini")}
+
+def llm_limited():
+    """True when AI keys are configured but every provider is out of rotation."""
+    keyed=[p for p,k in (("groq",GROQ_API_KEY),("gemini",GEMINI_API_KEY)) if k]
+    return bool(keyed) and not any(PROVIDERS[p].ready() for p in keyed)
+
+SUMMARY_SYS = ("You extract key facts from CSE corporate disclosures. Write 2-3 sentences with SPECIFIC details. "
+    "Include: quantities, rupee amounts, percentages, dates, positions. NEVER include person names. "
+    "Focus ONLY on what the company announces. NEVER start with 'Here are the facts'.")
+
+def summary_key(cleaned, company, subject, batch=False):
+    """Memo key over exactly what the prompt carries: 2000 chars for a single call, LLM_BATCH_CHARS under the batch prompt."""
+    k=[PROMPT_VERSION,GROQ_MODEL,GEMINI_MODEL,company,subject,cleaned[:LLM_BATCH_CHARS] if batch else cleaned[:2000]]
+    return hashlib.sha256(json.dumps(k+["batch"] if batch else k).encode()).hexdigest()
+
+def _memo_get(key):
+    hit=CACHE.get_json("summary",key) if CACHE else None
+    return hit if hit and (hit["ok"] or time.time()-hit["t"]<SUMMARY_NEG_TTL) else None
+
+def _llm_input(raw):
+    if not raw or len(raw)<30: return ""
     cleaned = pre_clean(raw)
-    if len(cleaned)<30: cleaned = re.sub(r'\s+',' ',raw).strip()[:2000]
-    if len(cleaned)<30: return None
-    sys_msg = ("You extract key facts from CSE corporate disclosures. Write 2-3 sentences with SPECIFIC details. "
-        "Include: quantities, rupee amounts, percentages, dates, positions. NEVER include person names. "
-        "Focus ONLY on what the company announces. NEVER start with 'Here are the facts'.")
+    if len(cleaned)<30: cleaned = _WS.sub(' ',raw).strip()[:2000]
+    return cleaned if len(cleaned)>=30 else ""
+
+def _tidy_summary(s):
+    s=re.sub(r'\n+',' ',re.sub(r'\*+','',s or "")).strip()
+    for px in [r'^here are the specific facts[^:]*:\s*',r'^summary:\s*']:
+        s=re.sub(px,'',s,flags=re.IGNORECASE).strip()
+    return s
+
+def ai_summarize(raw, company="", subject="", log=print):
+    cleaned=_llm_input(raw)
+    if not cleaned: return None
+    key=summary_key(cleaned,company,subject); hit=_memo_get(key)
+    METRICS.inc("summary_memo",result="hit" if hit else "miss")
+    if hit: log(f"      AI summary (memo{'' if hit['ok'] else ', known bad'})"); return hit["s"]
+    with METRICS.span("ai_summarize"): s,answered=_llm_summarize(cleaned,company,subject,log)
+    # Only remember a miss if a provider actually answered; errors and 429s stay retryable.
+    if CACHE and (s or answered): CACHE.put_json("summary",key,{"s":s,"ok":bool(s) and is_good(s) and not is_fallback(s),"t":time.time()})
+    return s
+
+def _llm_summarize(cleaned, company, subject, log):
+    """Groq first, Gemini second. Returns (summary or None, whether any provider answered 200)."""
+    answered=False; sys_msg=SUMMARY_SYS
     usr = f"Company: {company}\nCategory: {subject}\n\nExtract specific facts:\n{cleaned[:2000]}"
-    if GROQ_API_KEY:
+    if GROQ_API_KEY and PROVIDERS["groq"].ready():
         for att in range(3):
             try:
-                r = requests.post("https://api.groq.com/openai/v1/chat/completions",
-                    headers={"Content-Type":"application/json","Authorization":f"Bearer {GROQ_API_KEY}"},
-                    json={"model":"llama-3.3-70b-versatile","messages":[{"role":"system","content":sys_msg},{"role":"user","content":usr}],
-                          "max_tokens":200,"temperature":0.1},timeout=25)
+                with METRICS.span("llm",provider="groq"):
+                    r = http("POST","groq","https://api.groq.com/openai/v1/chat/completions","llm",
+                        headers={"Content-Type":"application/json","Authorization":f"Bearer {GROQ_API_KEY}"},
+                        json={"model":GROQ_MODEL,"messages":[{"role":"system","content":sys_msg},{"role":"user","content":usr}],
+                              "max_tokens":200,"temperature":0.1})
+                METRICS.inc("llm_requests",provider="groq",attempt=att+1,status=r.status_code); wait=PROVIDERS["groq"].record(r)
                 if r.status_code==200:
-                    ch=r.json().get("choices",[])
+                    answered=True; ch=r.json().get("choices",[])
                     if ch:
-                        s=re.sub(r'\n+',' ',re.sub(r'\*+','',ch[0].get("message",{}).get("content",""))).strip()
-                        for px in [r'^here are the specific facts[^:]*:\s*',r'^summary:\s*']:
-                            s=re.sub(px,'',s,flags=re.IGNORECASE).strip()
-                        if is_good(s): return s
-                        elif att<2: time.sleep(3); continue
-                        elif s and len(s)>30: return s
-                elif r.status_code==429: log("      Groq rate limited"); time.sleep(20)
+                        s=_tidy_summary(ch[0].get("message",{}).get("content",""))
+                        if is_good(s): return s,True
+                        elif att<2: pause(3); continue
+                        elif s and len(s)>30: return s,True
+                elif r.status_code==429:
+                    log("      Groq rate limited"+(f", out of rotation for {wait:.0f}s" if wait else ""))
+                    if wait: break
                 else: break
             except Exception as e: log(f"      Groq error: {e}"); break
-    if GEMINI_API_KEY:
+    if GEMINI_API_KEY and PROVIDERS["gemini"].ready():
         try:
-            r=requests.post(f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-lite:generateContent?key={GEMINI_API_KEY}",
-                headers={"Content-Type":"application/json"},
-                json={"contents":[{"parts":[{"text":f"{sys_msg}\n\n{usr}"}]}],"generationConfig":{"maxOutputTokens":200,"temperature":0.1}},timeout=25)
+            with METRICS.span("llm",provider="gemini"):
+                r=http("POST","gemini",f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}","llm",
+                    headers={"Content-Type":"application/json"},
+                    json={"contents":[{"parts":[{"text":f"{sys_msg}\n\n{usr}"}]}],"generationConfig":{"maxOutputTokens":200,"temperature":0.1}})
+            METRICS.inc("llm_requests",provider="gemini",attempt=1,status=r.status_code); PROVIDERS["gemini"].record(r)
+            if r.status_code==429: log("      Gemini rate limited")
             if r.status_code==200:
-                c=r.json().get("candidates",[])
+                answered=True; c=r.json().get("candidates",[])
                 if c:
                     p=c[0].get("content",{}).get("parts",[])
                     if p:
                         s=re.sub(r'\*+','',p[0].get("text","")).strip()
-                        if is_good(s): return s
+                        if is_good(s): return s,True
         except Exception as e: log(f"      Gemini error: {e}")
-    return None
+    return None,answered
+
+def ai_summarize_batch(jobs, log=print):
+    """Summarize several (raw, company, subject) jobs in one LLM request, each under an ID.
+    Returns summaries aligned with jobs; None means "use ai_summarize" (single-call memo hit, parse failure or not is_good).
+    Results are memoized under their own batch key, never the single-call one: the batch sees less text under another prompt."""
+    out=[None]*len(jobs); todo=[]
+    for i,(raw,co,subj) in enumerate(jobs):
+        cleaned=_llm_input(raw)
+        if not cleaned or _memo_get(summary_key(cleaned,co,subj)): continue
+        key=summary_key(cleaned,co,subj,batch=True); hit=_memo_get(key)
+        if hit: METRICS.inc("summary_memo",result="batch"); out[i]=hit["s"]
+        else: todo.append((i,cleaned,co,subj,key))
+    if len(todo)<2: return out
+    sys_msg=SUMMARY_SYS+(" You will get several disclosures, each under an ID. "
+        'Reply with ONLY a JSON object mapping each ID to its summary, e.g. {"d0": "...", "d1": "..."}.')
+    usr="\n\n".join(f"### ID d{n}\nCompany: {co}\nCategory: {subj}\n{cleaned[:LLM_BATCH_CHARS]}" for n,(_,cleaned,co,subj,_) in enumerate(todo))
+    with METRICS.span("ai_summarize_batch"): txt=_llm_batch_request(sys_msg,usr,200*len(todo),log)
+    try:
+        parsed=json.loads(re.sub(r'^```(?:json)?\s*|\s*```$','',txt.strip()))
+        if not isinstance(parsed,dict): raise ValueError("not an object")
+    except ValueError: log(f"  AI batch: no usable response, {len(todo)} item(s) go single"); return out
+    ok=0
+    for n,(i,cleaned,co,subj,key) in enumerate(todo):
+        s=parsed.get(f"d{n}"); s=_tidy_summary(s) if isinstance(s,str) else ""
+        if is_good(s) and not is_fallback(s):
+            out[i]=s; ok+=1
+            if CACHE: CACHE.put_json("summary",key,{"s":s,"ok":True,"t":time.time()})
+    METRICS.inc("batch_summaries",n=ok,result="ok"); METRICS.inc("batch_summaries",n=len(todo)-ok,result="single")
+    log(f"  AI batch: {ok}/{len(todo)} summarized in one request")
+    return out
+
+def _llm_batch_request(sys_msg, usr, max_tokens, log):
+    """One JSON-mode request, Groq first then Gemini (each only while in rotation). Returns the raw response text or ""."""
+    if GROQ_API_KEY and PROVIDERS["groq"].ready():
+        try:
+            r=http("POST","groq","https://api.groq.com/openai/v1/chat/completions","llm",
+                headers={"Content-Type":"application/json","Authorization":f"Bearer {GROQ_API_KEY}"},
+                json={"model":GROQ_MODEL,"messages":[{"role":"system","content":sys_msg},{"role":"user","content":usr}],
+                      "max_tokens":max_tokens,"temperature":0.1,"response_format":{"type":"json_object"}})
+            METRICS.inc("llm_requests",provider="groq",attempt="batch",status=r.status_code); PROVIDERS["groq"].record(r)
+            if r.status_code==200:
+                ch=r.json().get("choices",[])
+                if ch: return ch[0].get("message",{}).get("content","") or ""
+            elif r.status_code==429: log("  AI batch: Groq rate limited")
+        except Exception as e: log(f"  AI batch: Groq error: {e}")
+    if GEMINI_API_KEY and PROVIDERS["gemini"].ready():
+        try:
+            r=http("POST","gemini",f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}","llm",
+                headers={"Content-Type":"application/json"},
+                json={"contents":[{"parts":[{"text":f"{sys_msg}\n\n{usr}"}]}],
+                      "generationConfig":{"maxOutputTokens":max_tokens,"temperature":0.1,"responseMimeType":"application/json"}})
+            METRICS.inc("llm_requests",provider="gemini",attempt="batch",status=r.status_code); PROVIDERS["gemini"].record(r)
+            if r.status_code==200:
+                c=r.json().get("candidates",[])
+                if c:
+                    p=c[0].get("content",{}).get("parts",[])
+                    if p: return p[0].get("text","") or ""
+        except Exception as e: log(f"  AI batch: Gemini error: {e}")
+    return ""
+
+# ─── DEDUP INDEX ──────────────────────────────────────────────────────
+_PDF_SUFFIX = re.compile(r'\|PDF\d+$')
+
+class KeyIndex:
+    """Set of sheet ukeys. `ukey in idx` is O(1) and also matches the ukey's `|PDFn` rows."""
+    def __init__(self, keys=()):
+        self.keys=set(); self.bases=set()
+        for k in keys: self.add(k)
+    def add(self, k):
+        if not k: return
+        self.keys.add(k); self.bases.add(_PDF_SUFFIX.sub('',k))
+    def __contains__(self, k): return k in self.bases or k in self.keys
+    def __len__(self): return len(self.keys)
+    def __iter__(self): return iter(self.keys)
+
+# ─── LOCAL STORE ──────────────────────────────────────────────────────
+SHEET_HEADERS = ["Date","Time","Company","Subject","Description","AI Summary","PDF Link","PDF Count","Unique Key"]
+
+class Store:
+    """Local SQLite (WAL) system of record. `rows` mirrors the sheet, one row per sheet row; rows with
+    synced=0 have not reached the sheet yet and are pushed by GoogleManager.flush. `tab` is NULL for the
+    recent (first) tab, else the archive tab the row rolled into; `sheet_row` is the row on that tab.
+    `search` is an FTS5 index with one document per announcement, rowid = its first row's rowid."""
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rows(ukey TEXT PRIMARY KEY, base TEXT NOT NULL, ann_id TEXT,
+        date TEXT, time TEXT, company TEXT, subject TEXT, description TEXT, summary TEXT, pdf_link TEXT, pdf_count INTEGER,
+        created REAL, synced INTEGER NOT NULL DEFAULT 0, sheet_row INTEGER, tab TEXT);
+    CREATE INDEX IF NOT EXISTS rows_base ON rows(base);
+    CREATE INDEX IF NOT EXISTS rows_ann ON rows(ann_id);
+    CREATE INDEX IF NOT EXISTS rows_sheet_row ON rows(sheet_row);
+    CREATE INDEX IF NOT EXISTS rows_unsynced ON rows(synced) WHERE synced=0;
+    CREATE TABLE IF NOT EXISTS announcements(ann_id TEXT PRIMARY KEY, ukey TEXT, company TEXT, category TEXT,
+        date TEXT, time TEXT, detail TEXT, fetched REAL);
+    CREATE INDEX IF NOT EXISTS announcements_ukey ON announcements(ukey);
+    CREATE TABLE IF NOT EXISTS pdfs(url TEXT PRIMARY KEY, ann_id TEXT, text TEXT, fetched REAL);
+    CREATE INDEX IF NOT EXISTS pdfs_ann ON pdfs(ann_id);
+    CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+    """
+    COLS = "date,time,company,subject,description,summary,pdf_link,pdf_count,ukey"
+    def __init__(self, path):
+        d=os.path.dirname(path)
+        if d: os.makedirs(d,exist_ok=True)
+        self.lock=threading.RLock(); self.db=sqlite3.connect(path,check_same_thread=False,isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL"); self.db.executescript(self.SCHEMA)
+        if "tab" not in {r[1] for r in self.db.execute("PRAGMA table_info(rows)")}: self.db.execute("ALTER TABLE rows ADD COLUMN tab TEXT")
+        try: self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(company, category, day UNINDEXED, summary, text, tokenize='porter unicode61')"); self.fts=True
+        except sqlite3.OperationalError: self.fts=False  # SQLite built without FTS5
+    def q(self, sql, args=()):
+        with self.lock: return self.db.execute(sql,args).fetchall()
+    def many(self, sql, seq):
+        with self.lock:
+            self.db.execute("BEGIN")
+            try: self.db.executemany(sql,seq); self.db.execute("COMMIT")
+            except: self.db.execute("ROLLBACK"); raise
+    def q_in(self, sql, keys):
+        """`sql` with one {} for an IN list, run over `keys` 500 at a time."""
+        keys=list(keys)
+        return [r for i in range(0,len(keys),500) for r in self.q(sql.format(",".join("?"*len(keys[i:i+500]))),keys[i:i+500])]
+    def meta(self, key, default=None):
+        r=self.q("SELECT value FROM meta WHERE key=?",(key,)); return r[0][0] if r else default
+    def set_meta(self, key, value): self.q("INSERT OR REPLACE INTO meta VALUES(?,?)",(key,str(value)))
+    def keys(self): return [r[0] for r in self.q("SELECT ukey FROM rows")]
+    def add_rows(self, rows, ann_id=None):
+        now=time.time()
+        self.many(f"INSERT OR IGNORE INTO rows({self.COLS},base,ann_id,created) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)",
+            [(*r,_PDF_SUFFIX.sub('',r[8]),str(ann_id) if ann_id is not None else None,now) for r in rows])
+        self.index({_PDF_SUFFIX.sub('',r[8]) for r in rows})
+    def unsynced(self):
+        return [(r[8],list(r)) for r in self.q(f"SELECT {self.COLS} FROM rows WHERE synced=0 ORDER BY rowid")]
+    def unsynced_count(self): return self.q("SELECT COUNT(*) FROM rows WHERE synced=0")[0][0]
+    def mark_synced(self, ukeys, first_row=None):
+        self.many("UPDATE rows SET synced=1, sheet_row=? WHERE ukey=?",[(first_row+i if first_row else None,k) for i,k in enumerate(ukeys)])
+    def import_sheet_keys(self, keys):
+        """Record the recent tab's Unique Key column (row 2 onwards) as synced rows, refreshing their row numbers.
+        Recent-tab rows that are no longer there (rolled by another writer) keep their key but lose their row."""
+        now=time.time()
+        self.q("UPDATE rows SET sheet_row=NULL WHERE tab IS NULL AND synced=1")
+        self.many("INSERT INTO rows(ukey,base,created,synced,sheet_row) VALUES(?,?,?,1,?) "
+            "ON CONFLICT(ukey) DO UPDATE SET sheet_row=excluded.sheet_row, tab=NULL, synced=1",
+            [(k,_PDF_SUFFIX.sub('',k),now,i) for i,k in enumerate(keys,start=2) if k])
+    def bare_rows(self):
+        """Recent-tab row numbers the store knows only by key (another writer's rows): no date, company, summary yet."""
+        return [r[0] for r in self.q("SELECT sheet_row FROM rows WHERE tab IS NULL AND sheet_row IS NOT NULL AND company IS NULL ORDER BY sheet_row")]
+    def fill_rows(self, values):
+        """Fill key-only rows from their full sheet rows, so the feed and the search index cover them."""
+        values=[(list(r)+[""]*9)[:9] for r in values if len(r)>8 and r[8]]
+        self.many("UPDATE rows SET date=?, time=?, company=?, subject=?, description=?, summary=?, pdf_link=?, pdf_count=? "
+            "WHERE ukey=? AND company IS NULL",values)
+        self.index({_PDF_SUFFIX.sub('',r[8]) for r in values})
+    def import_archive_keys(self, keys):
+        """Record key-index entries (rows rolled into some archive tab) as synced rows."""
+        self.many("INSERT INTO rows(ukey,base,created,synced,tab) VALUES(?,?,?,1,'archive') "
+            "ON CONFLICT(ukey) DO UPDATE SET sheet_row=CASE WHEN tab IS NULL THEN NULL ELSE sheet_row END, tab=COALESCE(tab,'archive'), synced=1",
+            [(k,_PDF_SUFFIX.sub('',k),time.time()) for k in keys if k])
+    def import_sheet_rows(self, values, tab=None):
+        """Load full rows (row 2 onwards) of the recent tab, or of archive `tab`, into the store, e.g. so the feed
+        covers history written before it."""
+        now=time.time()
+        self.many(f"INSERT INTO rows({self.COLS},base,created,synced,sheet_row,tab) VALUES(?,?,?,?,?,?,?,?,?,?,?,1,?,?) "
+            "ON CONFLICT(ukey) DO UPDATE SET date=excluded.date, time=excluded.time, company=excluded.company, subject=excluded.subject, "
+            "description=excluded.description, summary=excluded.summary, pdf_link=excluded.pdf_link, pdf_count=excluded.pdf_count, "
+            "sheet_row=excluded.sheet_row, tab=excluded.tab, synced=1",
+            [(*(list(r)+[""]*9)[:9],_PDF_SUFFIX.sub('',r[8]),now,i,tab) for i,r in enumerate(values,start=2) if len(r)>8 and r[8]])
+        self.index({_PDF_SUFFIX.sub('',r[8]) for r in values if len(r)>8 and r[8]})
+        if tab is None: self.set_meta("sheet_rows_at",now)
+    def recent_rows(self): return (self.q("SELECT MAX(sheet_row) FROM rows WHERE tab IS NULL")[0][0] or 1)-1
+    def move_rows(self, tab, ukeys, first_row=None):
+        """Rows rolled off the recent tab into archive `tab`, appended there from `first_row`."""
+        self.many("UPDATE rows SET tab=?, sheet_row=? WHERE ukey=?",[(tab,first_row+i if first_row else None,k) for i,k in enumerate(ukeys)])
+    def shift_recent(self, n):
+        """The recent tab's rows 2..n+1 were deleted: later rows move up by n."""
+        self.q("UPDATE rows SET sheet_row=CASE WHEN sheet_row>? THEN sheet_row-? END WHERE tab IS NULL AND sheet_row IS NOT NULL",(n+1,n))
+    def set_summaries(self, cells):
+        self.many("UPDATE rows SET summary=? WHERE sheet_row=? AND tab IS NULL",[(v,rn) for rn,v in cells])
+        self.index(b for (b,) in self.q_in("SELECT base FROM rows WHERE tab IS NULL AND sheet_row IN ({})",{rn for rn,_ in cells}))
+    def index(self, bases=None):
+        """Refresh the search documents of `bases` (all if None): company, category, date and summary of the
+        announcement's first row, plus the PDF text stored for it (else the row description)."""
+        if not self.fts: return
+        sel="SELECT MIN(rowid),company,subject,date,summary,description,ann_id FROM rows WHERE company IS NOT NULL AND company!=''"
+        docs=self.q(sel+" GROUP BY base") if bases is None else self.q_in(sel+" AND base IN ({}) GROUP BY base",set(bases))
+        if not docs: return
+        text=dict(self.q_in("SELECT ann_id,group_concat(text,char(10)) FROM pdfs WHERE text IS NOT NULL AND ann_id IN ({}) GROUP BY ann_id",{d[6] for d in docs if d[6]}))
+        day=lambda d: (w.strftime("%Y-%m-%d") if (w:=_row_when(d or "","")) else "")
+        self.many("INSERT OR REPLACE INTO search(rowid,company,category,day,summary,text) VALUES(?,?,?,?,?,?)",
+            [(rid,co,cat or "",day(d),sm or "",text.get(aid) or desc or "") for rid,co,cat,d,sm,desc,aid in docs])
+    def put_announcement(self, ann_id, ukey, item, detail):
+        self.q("INSERT OR REPLACE INTO announcements VALUES(?,?,?,?,?,?,?,?)",(str(ann_id),ukey,item.get("company",""),
+            item.get("announcementCategory",""),item.get("dateOfAnnouncement",""),ukey.split("|")[1],
+            json.dumps(detail) if detail else None,time.time()))
+    def put_pdf(self, url, ann_id, text=None):
+        self.q("INSERT INTO pdfs VALUES(?,?,?,?) ON CONFLICT(url) DO UPDATE SET text=COALESCE(excluded.text,text), fetched=excluded.fetched",
+            (url,str(ann_id) if ann_id is not None else None,text,time.time()))
+
+def _open_store(path):
+    if not path: return None
+    try: return Store(path)
+    except (OSError,sqlite3.Error) as e: print(f"✗ Local store disabled ({path}): {e}"); return None
+
+class _LazyStore:
+    """The Store, opened on first use, so importing this module (benches, tools) creates no database.
+    Falsy when the store is off or failed to open; attribute access goes to the opened Store."""
+    def __init__(self, path): self.path=path; self.store=None; self.opened=False; self.lock=threading.Lock()
+    def get(self):
+        if not self.opened:
+            with self.lock:
+                if not self.opened: self.store=_open_store(self.path); self.opened=True
+        return self.store
+    def __bool__(self): return self.get() is not None
+    def __getattr__(self, name): return getattr(self.get(),name)
+
+STORE = _LazyStore(DB_PATH)
+
+# ─── SINKS ────────────────────────────────────────────────────────────
+# Every new row goes to the sheet and to each sink in CSE_SINKS ("kind:path", comma separated). Sinks are
+# append-only: later summary fixes and upgrades reach the sheet and the store, not the sinks.
+SINK_FIELDS = Store.COLS.split(",")+["ann_id","written"]
+
+def _record(row, ann_id, written):
+    r=dict(zip(SINK_FIELDS,(list(row)+[""]*9)[:9]),ann_id=str(ann_id) if ann_id is not None else None,written=written)
+    try: r["pdf_count"]=int(r["pdf_count"] or 0)
+    except ValueError: r["pdf_count"]=0
+    return r
+
+class Sink:
+    """write(rows, ann_id) gets each batch of new sheet rows; flush() makes buffered rows durable. Both are
+    no-ops here; sinks override what they need."""
+    def write(self, rows, ann_id=None): pass
+    def flush(self): pass
+
+class JsonlSink(Sink):
+    """Append-only JSON Lines file, one object per row."""
+    def __init__(self, path):
+        d=os.path.dirname(path)
+        if d: os.makedirs(d,exist_ok=True)
+        self.f=open(path,"a",encoding="utf-8"); self.lock=threading.Lock()
+    def write(self, rows, ann_id=None):
+        w=datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.lock: self.f.writelines(json.dumps(_record(r,ann_id,w),ensure_ascii=False)+"\n" for r in rows)
+    def flush(self):
+        with self.lock: self.f.flush()
+
+class ParquetSink(Sink):
+    """Hive-style daily partitions DIR/day=YYYY-MM-DD/part-*.parquet by row date. Rows are buffered and each
+    flush writes one columnar file per day touched. Needs pyarrow."""
+    def __init__(self, path):
+        import pyarrow as pa
+        self.path=path; self.buf=defaultdict(list); self.n=0; self.lock=threading.Lock()
+        self.schema=pa.schema([(f,pa.int64() if f=="pdf_count" else pa.string()) for f in SINK_FIELDS])
+    def write(self, rows, ann_id=None):
+        w=datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.lock:
+            for r in rows:
+                d=_row_when(str(r[0]),""); self.buf[d.strftime("%Y-%m-%d") if d else "undated"].append(_record(r,ann_id,w))
+            self.n+=len(rows); full=self.n>=PARQUET_BATCH
+        if full: self.flush()
+    def flush(self):
+        import pyarrow as pa, pyarrow.parquet as pq
+        with self.lock: buf,self.buf,self.n=self.buf,defaultdict(list),0
+        failed={}; err=None
+        for day,recs in sorted(buf.items()):
+            d=os.path.join(self.path,f"day={day}"); f=f"part-{time.time_ns()}.parquet"
+            try:
+                os.makedirs(d,exist_ok=True)
+                pq.write_table(pa.Table.from_pylist(recs,schema=self.schema),os.path.join(d,"."+f))  # readers skip dot files
+                os.replace(os.path.join(d,"."+f),os.path.join(d,f))
+            except Exception as e: failed[day]=recs; err=err or e
+        if failed:  # every day not written goes back in the buffer for the next flush
+            with self.lock:
+                for day,recs in failed.items(): self.buf[day][:0]=recs; self.n+=len(recs)
+            raise OSError(f"{len(failed)} day partition(s) not written, kept for the next flush: {err}")
+
+class SqliteSink(Sink):
+    """Table `disclosures` in its own SQLite file (not the tracker's store), one row per ukey."""
+    def __init__(self, path):
+        d=os.path.dirname(path)
+        if d: os.makedirs(d,exist_ok=True)
+        self.lock=threading.Lock(); self.db=sqlite3.connect(path,check_same_thread=False,isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS disclosures({', '.join(f+(' INTEGER' if f=='pdf_count' else ' TEXT')+(' PRIMARY KEY' if f=='ukey' else '') for f in SINK_FIELDS)})")
+        self.db.execute("CREATE INDEX IF NOT EXISTS disclosures_company ON disclosures(company)")
+    def write(self, rows, ann_id=None):
+        w=datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(f"INSERT OR IGNORE INTO disclosures({','.join(SINK_FIELDS)}) VALUES({','.join('?'*len(SINK_FIELDS))})",
+                    [tuple(_record(r,ann_id,w).values()) for r in rows]); self.db.execute("COMMIT")
+            except: self.db.execute("ROLLBACK"); raise
+
+SINK_TYPES = {"jsonl": JsonlSink, "parquet": ParquetSink, "sqlite": SqliteSink}
+_SINKS = None
+
+def sinks(log=print):
+    """The CSE_SINKS sinks, opened on first use. One that cannot be opened is logged and left out."""
+    global _SINKS
+    if _SINKS is None:
+        _SINKS=[]
+        for spec in filter(None,(x.strip() for x in SINKS_SPEC.split(","))):
+            kind,_,path=spec.partition(":")
+            if kind not in SINK_TYPES or not path: log(f"✗ Unknown sink {spec!r} (want jsonl:PATH, parquet:DIR or sqlite:PATH)"); continue
+            try: _SINKS.append(SINK_TYPES[kind](path)); log(f"✓ Sink {spec}")
+            except (ImportError,OSError,sqlite3.Error) as e: log(f"✗ Sink {spec} disabled: {e}")
+        if _SINKS: atexit.register(flush_sinks)
+    return _SINKS
+
+def write_rows(gm, rows, ann_id=None, log=print):
+    """Hand new rows to the sheet, then to every sink. A failing sink is logged; the sheet write stands."""
+    gm.write(rows,ann_id)
+    for s in sinks(log):
+        try: s.write(rows,ann_id); METRICS.inc("sink_rows",n=len(rows),sink=type(s).__name__)
+        except Exception as e: METRICS.inc("sink_errors",sink=type(s).__name__); log(f"    ✗ {type(s).__name__}: {e}")
+
+def flush_sinks(log=print):
+    for s in _SINKS or []:
+        try: s.flush()
+        except Exception as e: METRICS.inc("sink_errors",sink=type(s).__name__); log(f"  ✗ {type(s).__name__} flush: {e}")
 
 # ─── GOOGLE SHEETS ────────────────────────────────────────────────────
-class GoogleManager:
+class GoogleManager(Sink):
     def __init__(self, log_callback=None):
         self.log = log_callback or print
         import gspread; from google.oauth2.service_account import Credentials
         scopes=["https://www.googleapis.com/auth/spreadsheets","https://www.googleapis.com/auth/drive.readonly"]
         sa_json = os.environ.get("SERVICE_ACCOUNT_KEY")
         if sa_json:
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w',suffix='.json',delete=False) as f: f.write(sa_json); sa_path=f.name
-            creds=Credentials.from_service_account_file(sa_path,scopes=scopes); os.unlink(sa_path)
+            creds=Credentials.from_service_account_info(json.loads(sa_json),scopes=scopes)
             self.log("✓ Auth via env var")
         else:
             creds=Credentials.from_service_account_file(SERVICE_ACCOUNT_JSON,scopes=scopes)
             self.log("✓ Auth via file")
         self.gc=gspread.authorize(creds); self.service_account_email=creds.service_account_email
         self.spreadsheet=self.gc.open(SPREADSHEET_NAME); self.worksheet=self.spreadsheet.sheet1
+        self._rows=[]; self._cells=[]; self._wlock=threading.Lock(); self._last_flush=time.time(); self._tabs=None
         self.log(f"✓ Opened: {SPREADSHEET_NAME}")
-        hdrs=["Date","Time","Company","Subject","Description","AI Summary","PDF Link","PDF Count","Unique Key"]
         fr=self.worksheet.row_values(1)
-        if not fr or not any(fr): self.worksheet.update('A1:I1',[hdrs]); self.log("  ✓ Headers written")
-        else: self.log(f"  {len(self.worksheet.get_all_values())-1} existing rows")
+        if not fr or not any(fr): self.worksheet.update('A1:I1',[SHEET_HEADERS]); self.log("  ✓ Headers written")
     def get_existing_keys(self):
-        try: return set(self.worksheet.col_values(9)[1:])
-        except: return set()
+        # Recent-tab keys plus the key index of archived rows; archive tabs themselves are never read.
+        # The recent tab's key column (bounded by RECENT_MAX_ROWS) is read on every call, so rows other writers
+        # added (the GUI, a CI run whose cache was not saved) are always seen. With a local store the key index
+        # is only re-read every STORE_RECONCILE_SECS, from where it left off. Keys the store has not seen are
+        # then read in full (one batch_get), since the feed and search are built from the store.
+        if STORE:
+            if time.time()-float(STORE.meta("key_index_at",0))>=STORE_RECONCILE_SECS:
+                try:
+                    start=int(STORE.meta("key_index_row",2)); ak=self._key_index(start)
+                    STORE.import_archive_keys(ak); STORE.set_meta("key_index_row",start+len(ak)); STORE.set_meta("key_index_at",time.time())
+                except Exception as e: self.log(f"  ✗ Key index read failed: {e}")
+            try: STORE.import_sheet_keys(self.worksheet.col_values(9)[1:])
+            except Exception as e: self.log(f"  ✗ Key reconcile failed: {e}")
+            else:
+                try:
+                    bare=STORE.bare_rows()
+                    if bare: STORE.fill_rows(self._rows_at(bare)); self.log(f"  ✓ {len(bare)} sheet row(s) written elsewhere loaded into the store")
+                except Exception as e: self.log(f"  ✗ Row import failed: {e}")
+            return KeyIndex(STORE.keys())
+        try: return KeyIndex(self.worksheet.col_values(9)[1:]+self._key_index())
+        except: return KeyIndex()
+    def _tab(self, title, headers=None):
+        """Worksheet titled `title`, created with a `headers` row if missing (None if missing and no headers)."""
+        if self._tabs is None: self._tabs={w.title:w for w in self.spreadsheet.worksheets()}
+        if title not in self._tabs and headers:
+            ws=self.spreadsheet.add_worksheet(title=title,rows=1,cols=len(headers))
+            ws.update(f"A1:{chr(64+len(headers))}1",[headers]); self._tabs[title]=ws; self.log(f"  ✓ Created tab {title}")
+        return self._tabs.get(title)
+    def archive_tabs(self):
+        if self._tabs is None: self._tab(KEYS_TAB)
+        return [w for t,w in sorted(self._tabs.items()) if t.startswith(ARCHIVE_TAB.split("%")[0]) and t!=self.worksheet.title]
+    def _rows_at(self, rns):
+        """Recent-tab rows `rns` (sorted row numbers), read as one batch_get over their consecutive runs."""
+        runs=[]
+        for rn in rns:
+            if runs and rn==runs[-1][1]+1: runs[-1][1]=rn
+            else: runs.append([rn,rn])
+        with METRICS.span("sheet_read",step="rows"): got=self.worksheet.batch_get([f"A{a}:I{b}" for a,b in runs])
+        return [r for vr in got for r in vr]
+    def _key_index(self, start=2):
+        ws=self._tab(KEYS_TAB)
+        return [r[0] if r else "" for r in ws.get(f"A{start}:A")] if ws else []
+    def roll_over(self, state=None):
+        """Keep the recent tab (sheet1, what index.html loads) at RECENT_MAX_ROWS: once it is ROLL_BATCH rows
+        over, the oldest rows move to their month's archive tab and their keys to the key index. Returns rows moved;
+        `state`'s fix cursor is shifted with them."""
+        if not RECENT_MAX_ROWS or not self.flush(): return 0
+        if STORE and STORE.recent_rows()<RECENT_MAX_ROWS+ROLL_BATCH: return 0
+        with self._wlock:
+            try:
+                with METRICS.span("sheet_roll",step="read"):
+                    k=len(self.worksheet.col_values(9))-1-RECENT_MAX_ROWS
+                    if k<ROLL_BATCH: return 0
+                    rows=[(list(r)+[""]*9)[:9] for r in self.worksheet.get(f"A2:I{k+1}")]
+                tabs=defaultdict(list)
+                for r in rows:
+                    w=_row_when(r[0],""); tabs[w.strftime(ARCHIVE_TAB) if w else "Archive undated"].append(r)
+                with METRICS.span("sheet_roll",step="write"):
+                    for t,rs in sorted(tabs.items()):
+                        resp=self._tab(t,SHEET_HEADERS).append_rows(rs,value_input_option='RAW')
+                        if STORE: STORE.move_rows(t,[r[8] for r in rs],_first_row(resp))
+                    ak=[[r[8]] for r in rows if r[8]]; resp=self._tab(KEYS_TAB,[SHEET_HEADERS[8]]).append_rows(ak,value_input_option='RAW')
+                    self.worksheet.delete_rows(2,k+1)
+            except Exception as e: METRICS.inc("sheet_write_errors",kind="roll"); self.log(f"  ✗ Archive roll failed: {e}"); return 0
+        if STORE:
+            STORE.shift_recent(k)
+            if int(STORE.meta("key_index_row",2))==_first_row(resp): STORE.set_meta("key_index_row",_first_row(resp)+len(ak))
+        if state is not None and state.get("fix_cursor"): state["fix_cursor"]=max(0,state["fix_cursor"]-k)
+        METRICS.inc("sheet_rolled",n=k); self.log(f"  ✓ Rolled {k} row(s) into {', '.join(sorted(tabs))}")
+        return k
+    # Buffered writes: rows go out via append_rows, summary cells via batch_update. With a local store the
+    # row buffer is the store's unsynced rows, so rows survive a crash and are pushed by the next flush.
+    def append(self, row, ann_id=None):
+        if STORE: STORE.add_rows([row],ann_id)
+        else:
+            with self._wlock: self._rows.append(row)
+        self._maybe_flush()
+    def write(self, rows, ann_id=None):
+        for r in rows: self.append(r,ann_id)
+    def update_summary(self, rn, summary):
+        with self._wlock: self._cells.append((rn,summary))
+        self._maybe_flush()
+    def update_summaries(self, cells):
+        with self._wlock: self._cells.extend(cells)
+        return self.flush()
+    def pending(self): return (STORE.unsynced_count() if STORE else len(self._rows))+len(self._cells)
+    def _maybe_flush(self):
+        if self.pending()>=WRITE_BATCH_SIZE or time.time()-self._last_flush>=WRITE_FLUSH_SECS: self.flush()
+    def flush(self):
+        with self._wlock:
+            keyed=STORE.unsynced() if STORE else None
+            rows=[r for _,r in keyed] if STORE else self._rows; self._rows=[]
+            cells,self._cells=self._cells,[]; self._last_flush=time.time()
+            if rows:
+                try:
+                    with METRICS.span("sheet_write",kind="rows"): resp=self.worksheet.append_rows(rows,value_input_option='RAW')
+                    METRICS.inc("sheet_rows",n=len(rows)); self.log(f"  ✓ Flushed {len(rows)} row(s)")
+                    if STORE: STORE.mark_synced([k for k,_ in keyed],_first_row(resp))
+                except Exception as e:
+                    METRICS.inc("sheet_write_errors",kind="rows")
+                    if not STORE: self._rows[:0]=rows
+                    self.log(f"  ✗ Write error ({len(rows)} rows kept): {e}")
+            if cells:
+                try:
+                    with METRICS.span("sheet_write",kind="cells"):
+                        self.worksheet.batch_update([{"range":f"F{rn}","values":[[v]]} for rn,v in cells],value_input_option='RAW')
+                    METRICS.inc("sheet_cells",n=len(cells))
+                    if STORE: STORE.set_summaries(cells)
+                    self.log(f"  ✓ Flushed {len(cells)} summary fix(es)")
+                except Exception as e: self._cells[:0]=cells; METRICS.inc("sheet_write_errors",kind="cells"); self.log(f"  ✗ Update error ({len(cells)} cells kept): {e}")
+        return not self.pending()
+
+def _first_row(resp):
+    """First sheet row written by an append_rows response ("Sheet1!A105:I107" → 105), or None."""
+    m=re.search(r'![A-Z]+(\d+)',((resp or {}).get("updates") or {}).get("updatedRange","")) if isinstance(resp,dict) else None
+    return int(m.group(1)) if m else None
 
 # ─── CSE API ──────────────────────────────────────────────────────────
-def fetch_announcements(log=print):
-    items=[]
-    seen_ids=set()
-    
-    # Method 1: Scrape CSE website DOM (real-time data)
-    try:
-        from playwright.sync_api import sync_playwright
-        log("  Scraping CSE website...")
-        with sync_playwright() as p:
-            browser=p.chromium.launch(headless=True)
-            page=browser.new_page()
-            page.goto("https://www.cse.lk/pages/corporate-disclosures/corporate-disclosures.component.html",timeout=30000)
-            page.wait_for_load_state("networkidle")
-            page.wait_for_timeout(5000)
-            # Extract announcement data from rendered page
-            scraped=page.evaluate("""() => {
-                const rows=document.querySelectorAll('.ann-row, .announcement-row, tr[class*=ann], .card, [class*=announce]');
-                const results=[];
-                rows.forEach(r=>{
-                    const text=r.innerText||'';
-                    if(text.length>10) results.push(text);
-                });
-                // Also try to grab from Angular component state
-                try {
-                    const el=document.querySelector('app-corporate-disclosures, [class*=corporate]');
-                    if(el && el.__ngContext__) {
-                        const ctx=el.__ngContext__;
-                        for(const item of ctx) {
-                            if(Array.isArray(item) && item.length>5 && item[0]?.announcementId) return item;
-                        }
-                    }
-                } catch(e){}
-                // Try getting data from page scripts
-                try {
-                    const scripts=document.querySelectorAll('script');
-                    for(const s of scripts) {
-                        if(s.textContent.includes('approvedAnnouncements')) {
-                            try { return JSON.parse(s.textContent).approvedAnnouncements; } catch(e){}
-                        }
-                    }
-                } catch(e){}
-                return results;
-            }""")
-            # Also intercept by making our own fetch from within the page context
-            page_api=page.evaluate("""async () => {
-                try {
-                    const r=await fetch('/api/approvedAnnouncement',{method:'POST',headers:{'Content-Type':'application/x-www-form-urlencoded'}});
-                    const d=await r.json();
-                    return d.approvedAnnouncements||[];
-                } catch(e){ return []; }
-            }""")
-            browser.close()
-            if page_api and isinstance(page_api,list) and len(page_api)>0 and isinstance(page_api[0],dict):
-                for it in page_api:
-                    aid=it.get("announcementId")
-                    if aid and aid not in seen_ids:
-                        items.append(it); seen_ids.add(aid)
-                log(f"  [Scrape] → {len(page_api)} items from page fetch")
-    except ImportError: log("  Playwright not installed")
-    except Exception as e: log(f"  Scrape error: {e}")
-    
-    # Method 2: Direct API (merge any new items)
-    try:
-        r=requests.post(CSE_API+"approvedAnnouncement",headers={**HTTP_HEADERS,'Content-Type':'application/x-www-form-urlencoded'},timeout=20)
-        if r.status_code==200:
-            api_items=r.json().get("approvedAnnouncements",[])
-            added=0
-            for it in api_items:
-                aid=it.get("announcementId")
-                if aid and aid not in seen_ids:
-                    items.append(it); seen_ids.add(aid); added+=1
-            log(f"  [API] → {len(api_items)} items ({added} new after merge)")
-    except Exception as e: log(f"  API error: {e}")
-    
+def fetch_announcements(log=print, mode=None):
+    mode=mode or FETCH_MODE
+    items=[]; seen_ids=set()
+    def merge(src, got):
+        added=0
+        for it in got or []:
+            aid=it.get("announcementId")
+            if aid and aid not in seen_ids: items.append(it); seen_ids.add(aid); added+=1
+        log(f"  [{src}] → {len(got or [])} items ({added} new after merge)")
+    with METRICS.span("fetch",feed="announcements",mode=mode):
+        api=_api_announcements(log)
+        if mode=="warm": merge("Browser",_browser_announcements(log,keep=True))
+        if api is not None: merge("API",api)
+        if mode=="fallback" and not api: merge("Browser",_browser_announcements(log,keep=False))
     if items:
         dates=sorted(set(it.get("dateOfAnnouncement","") for it in items))
         log(f"✓ Total: {len(items)} announcements ({dates[0]} → {dates[-1]})")
     else: log("✗ No announcements")
     return items[:MAX_DISCLOSURES]
 
+def _api_announcements(log):
+    """Direct approvedAnnouncement POST. None on failure."""
+    try:
+        r=http("POST","cse",CSE_API+"approvedAnnouncement","list",headers=FORM_HEADERS)
+        if r.status_code==200: return r.json().get("approvedAnnouncements",[])
+        log(f"  API HTTP {r.status_code}")
+    except Exception as e: log(f"  API error: {e}")
+    return None
+
+class BrowserFetcher:
+    """Headless Chromium parked on the disclosures page; fetch() runs the page's own approvedAnnouncement call."""
+    def __init__(self): self.pw=self.browser=self.page=None
+    def fetch(self):
+        if self.page is None:
+            from playwright.sync_api import sync_playwright
+            self.pw=sync_playwright().start(); self.browser=self.pw.chromium.launch(headless=True); self.page=self.browser.new_page()
+            self.page.goto(CSE_DISCLOSURES_PAGE,timeout=30000,wait_until="domcontentloaded")
+        return self.page.evaluate("""async () => {
+            const r=await fetch('/api/approvedAnnouncement',{method:'POST',headers:{'Content-Type':'application/x-www-form-urlencoded'}});
+            const d=await r.json();
+            return d.approvedAnnouncements||[];
+        }""")
+    def close(self):
+        for x in (self.browser,self.pw):
+            try:
+                if x: x.close() if x is self.browser else x.stop()
+            except Exception: pass
+        self.pw=self.browser=self.page=None
+
+_WARM_BROWSER = None
+
+def _browser_announcements(log, keep):
+    """Announcements via the browser. keep=True reuses one browser across calls (see close_browser)."""
+    global _WARM_BROWSER
+    bf=(_WARM_BROWSER or BrowserFetcher()) if keep else BrowserFetcher()
+    if keep: _WARM_BROWSER=bf
+    log("  Fetching via browser"+(" (warm)" if keep and bf.page else "")+"...")
+    try:
+        got=bf.fetch()
+        return [it for it in got if isinstance(it,dict)] if isinstance(got,list) else []
+    except ImportError: log("  Playwright not installed"); bf.close(); return []
+    except Exception as e: log(f"  Scrape error: {e}"); bf.close(); return []
+    finally:
+        if not keep: bf.close()
+
+def close_browser():
+    global _WARM_BROWSER
+    if _WARM_BROWSER: _WARM_BROWSER.close(); _WARM_BROWSER=None
+
 # ─── FINANCIAL REPORTS ────────────────────────────────────────────────
 def fetch_financial_reports(log=print):
     try:
-        r=requests.post(CSE_API+"getFinancialAnnouncement",
-            headers={**HTTP_HEADERS,'Content-Type':'application/x-www-form-urlencoded'},timeout=20)
+        with METRICS.span("fetch",feed="financials"): r=http("POST","cse",CSE_API+"getFinancialAnnouncement","list",headers=FORM_HEADERS)
         if r.status_code!=200:
             log(f"  [Financials] HTTP {r.status_code}"); return []
         data=r.json().get("reqFinancialAnnouncemnets",[])
@@ -357,55 +1182,254 @@ def process_financial_report(gm, item, existing_keys, log=print):
     else: ds=upload.upper(); ts=""
     cat=categorize_financial(file_text)
     ukey=f"{ds}|{ts}|{co}"
-    if ukey in existing_keys or any(k.startswith(ukey) for k in existing_keys): return 0
+    if ukey in existing_keys: return 0
     log(f"  {co[:40]} — {cat}")
     pdf_url=(CSE_CDN+path).replace(' ','%20') if path else ""
     summary=f"{co}: {file_text}." if file_text else f"{co} — {cat}."
+    write_rows(gm,[[ds,ts,co,cat,file_text[:200],summary,pdf_url,1 if pdf_url else 0,ukey]],log=log)
+    existing_keys.add(ukey); log("    ✓ Queued"); return 1
+
+DETAIL_ENDPOINTS = ("getAnnouncementById", "getGeneralAnnouncementById")
+_DETAIL_ROUTE = {}  # announcement category → endpoint that last answered for it
+
+def get_detail(ann_id, category=""):
+    if CACHE and ann_id:
+        d=CACHE.get_json("detail",ann_id)
+        METRICS.inc("detail_cache",result="hit" if d else "miss")
+        if d: return d
+    with METRICS.span("detail"): return _get_detail(ann_id,category)
+
+def _get_detail(ann_id, category):
+    eps=DETAIL_ENDPOINTS[::-1] if _DETAIL_ROUTE.get(category)==DETAIL_ENDPOINTS[1] else DETAIL_ENDPOINTS
+    for ep in eps:
+        try:
+            r=http("POST","cse",CSE_API+ep,"detail",data={"announcementId":ann_id},headers=FORM_HEADERS)
+            if r.status_code==200 and len(r.content)>5:
+                if category: _DETAIL_ROUTE[category]=ep
+                d=r.json()
+                if CACHE and ann_id and d: CACHE.put_json("detail",ann_id,d)
+                return d
+        except Exception: pass
+    return None
+
+def download_pdf_text(file_url, log=print):
+    # Cache: url → sha256 of the PDF ("pdf"), sha256 → bytes ("blob") and → extracted text ("text").
+    url=(CSE_CDN+file_url).replace(' ','%20'); h=content=None
+    if CACHE:
+        h=(CACHE.get("pdf",url) or b"").decode() or None
+        if h:
+            t=CACHE.get("text",h)
+            if t is not None: METRICS.inc("pdf_cache",result="text"); log("      PDF text (cached)"); return t.decode() or None
+            content=CACHE.get("blob",h)
+    METRICS.inc("pdf_cache",result="blob" if content is not None else "miss")
     try:
-        gm.worksheet.append_row([ds,ts,co,cat,file_text[:200],summary,pdf_url,1 if pdf_url else 0,ukey],value_input_option='RAW')
-        existing_keys.add(ukey); log("    ✓ Written"); return 1
-    except Exception as e:
-        log(f"    ✗ Write error: {e}"); return 0
+        if content is None:
+            with METRICS.span("pdf",stage="download"): content=_fetch_pdf(url,log)
+            if content is None: return None
+            h=hashlib.sha256(content).hexdigest()
+            if CACHE:
+                if CACHE_BLOBS: CACHE.put("blob",h,content)
+                CACHE.put("pdf",url,h.encode())
+        log(f"      PDF ({len(content):,} bytes)")
+        text,final=extract_pdf_text(content)
+        if CACHE and final: CACHE.put("text",h,text.encode())
+        return text or None
+    except Exception: pass
+    return None
 
-def get_detail(ann_id):
+def _fetch_pdf(url, log):
+    """Streamed GET capped at PDF_MAX_BYTES. Returns the bytes, or None if missing, oversized or not a PDF."""
+    r=http("GET","cdn",url,"pdf",headers={'User-Agent':HTTP_HEADERS['User-Agent'],'Referer':'https://www.cse.lk/'},stream=True)
     try:
-        r=requests.post(CSE_API+"getAnnouncementById",data={"announcementId":ann_id},headers={**HTTP_HEADERS,'Content-Type':'application/x-www-form-urlencoded'},timeout=15)
-        if r.status_code==200 and len(r.content)>5: return r.json()
-    except: pass
+        if r.status_code!=200: return None
+        if int(r.headers.get("Content-Length") or 0)>PDF_MAX_BYTES: log(f"      PDF too large ({r.headers['Content-Length']} bytes)"); return None
+        buf=bytearray()
+        for chunk in r.iter_content(65536):
+            if len(buf)==0 and chunk[:5]!=b'%PDF-': return None
+            buf+=chunk
+            if len(buf)>PDF_MAX_BYTES: log(f"      PDF too large (>{PDF_MAX_BYTES:,} bytes)"); return None
+        return bytes(buf) if buf else None
+    finally: r.close()
+
+def extract_pdf_text(content):
+    """Text layer of the first pages, stopping at PDF_TEXT_CHARS of cleaned text; OCR if there is none.
+    Returns (text or "", final) — final is False when OCR was needed but is not installed."""
+    import PyPDF2
+    with METRICS.span("pdf",stage="parse"):
+        reader=PyPDF2.PdfReader(io.BytesIO(content)); parts=[]
+        for i in range(min(len(reader.pages),PDF_MAX_PAGES)):
+            parts.append((reader.pages[i].extract_text() or "")+"\n")
+            if sum(map(len,parts))>=PDF_TEXT_CHARS and len(pre_clean("".join(parts)))>=PDF_TEXT_CHARS: break
+    text="".join(parts).strip()
+    if len(text)>30: return text,True
+    METRICS.inc("pdf_scanned",ocr=has_ocr())
+    if not has_ocr(): return "",False
+    with METRICS.span("pdf",stage="ocr"): ocr=ocr_pdf(content,min(OCR_PAGES,len(reader.pages)))
+    return (ocr if len(ocr)>30 else ""),True
+
+_OCR_POOL = None; _HAS_OCR = None
+
+def has_ocr():
+    """pdf2image and pytesseract are installed (checked on the first scanned PDF)."""
+    global _HAS_OCR
+    if _HAS_OCR is None:
+        try: import pdf2image, pytesseract; _HAS_OCR=True
+        except ImportError: _HAS_OCR=False
+    return _HAS_OCR
+
+def _ocr_page(args):
+    from pdf2image import convert_from_bytes; import pytesseract
+    content,page=args
+    imgs=convert_from_bytes(content,dpi=OCR_DPI,first_page=page,last_page=page)
+    return pytesseract.image_to_string(imgs[0]) if imgs else ""
+
+def ocr_pdf(content, pages):
+    """Rasterize and OCR only pages 1..pages, in parallel worker processes."""
+    global _OCR_POOL
+    if pages<1: return ""
     try:
-        r=requests.post(CSE_API+"getGeneralAnnouncementById",data={"announcementId":ann_id},headers={**HTTP_HEADERS,'Content-Type':'application/x-www-form-urlencoded'},timeout=15)
-        if r.status_code==200 and r.text!="{}": return r.json()
-    except: pass
-    return None
+        if _OCR_POOL is None:
+            import multiprocessing
+            _OCR_POOL=ProcessPoolExecutor(max_workers=min(OCR_PAGES,os.cpu_count() or 1),mp_context=multiprocessing.get_context("spawn"))
+        return "".join(t+"\n" for t in _OCR_POOL.map(_ocr_page,[(content,i) for i in range(1,pages+1)])).strip()
+    except Exception: return ""
 
-def download_pdf_text(file_url, log=print):
-    url=(CSE_CDN+file_url).replace(' ','%20')
+# ─── RUN STATE ────────────────────────────────────────────────────────
+def load_state():
     try:
-        r=requests.get(url,headers={'User-Agent':HTTP_HEADERS['User-Agent'],'Referer':'https://www.cse.lk/'},timeout=20)
-        if r.status_code!=200 or r.content[:5]!=b'%PDF-': return None
-        log(f"      PDF ({len(r.content):,} bytes)")
-        reader=PyPDF2.PdfReader(io.BytesIO(r.content))
-        text="".join((p.extract_text() or "")+"\n" for p in reader.pages).strip()
-        if len(text)>30: return text
-        if HAS_OCR:
-            try:
-                imgs=convert_from_bytes(r.content,dpi=200)
-                ocr="".join(pytesseract.image_to_string(i)+"\n" for i in imgs[:3]).strip()
-                if len(ocr)>30: return ocr
-            except: pass
-    except: pass
+        with open(STATE_FILE) as f: return json.load(f)
+    except (OSError,ValueError): return {}
+
+def save_state(state):
+    try:
+        d=os.path.dirname(STATE_FILE)
+        if d: os.makedirs(d,exist_ok=True)
+        with open(STATE_FILE+".tmp","w") as f: json.dump(state,f)
+        os.replace(STATE_FILE+".tmp",STATE_FILE)
+    except OSError: pass
+
+def _uploaded_ts(s):
+    for fmt in ("%d %b %Y %I:%M %p","%d %b %Y %I:%M:%S %p","%d %b %Y %H:%M:%S","%d %b %Y %H:%M","%d %b %Y"):
+        try: return datetime.strptime((s or "").strip(),fmt).timestamp()*1000
+        except ValueError: pass
+    return 0
+
+FEEDS = {  # feed: (identity, high-water stamp)
+    "announcements": (lambda it: str(it.get("announcementId")), lambda it: it.get("createdDate") or 0),
+    "financials": (lambda it: f"{it.get('path','')}|{it.get('uploadedDate','')}", lambda it: _uploaded_ts(it.get("uploadedDate")))}
+
+def feed_delta(state, feed, items):
+    """Items not in the feed's last saved response or newer than its watermark, plus the entry to save once
+    they are written. An identical fingerprint means nothing changed."""
+    ident,stamp=FEEDS[feed]; prev=state.get(feed)
+    if not items: return [],prev
+    ids=[ident(it) for it in items]
+    entry={"fp":hashlib.sha1(json.dumps([ids,[stamp(it) for it in items]]).encode()).hexdigest(),
+           "ids":ids,"mark":max(stamp(it) for it in items)}
+    if not prev: return items,entry
+    if prev.get("fp")==entry["fp"]: return [],entry
+    seen=set(prev.get("ids",[])); mark=prev.get("mark",0)
+    return [it for it,i in zip(items,ids) if i not in seen or stamp(it)>mark],entry
+
+# ─── JSON FEED ────────────────────────────────────────────────────────
+FEED_GROUPS = [  # mirrors grp() in index.html
+    ("Dividends", lambda s: "CASH DIVIDEND" in s),
+    ("Dealings", lambda s: "DEALINGS BY DIRECTORS" in s),
+    ("Rights Issue", lambda s: "RIGHTS ISSUE" in s),
+    ("Splits", lambda s: "SPLIT" in s or "SUB DIVISION" in s or "SUB-DIVISION" in s),
+    ("Restructuring", lambda s: any(k in s for k in ("APPOINTMENT","RESIGNATION","RETIREMENT","REMOVAL","DEATH"))),
+    ("Financials", lambda s: "ERRATA" not in s and any(k in s for k in ("FINANCIAL STATEMENT","ANNUAL REPORT","QUARTERLY FINANCIAL","INTERIM FINANCIAL","AUDITED FINANCIAL")))]
+
+def feed_group(subject):
+    s=(subject or "").upper()
+    return next((n for n,m in FEED_GROUPS if m(s)),"Other")
+
+def _row_when(d, t):
+    for fmt in ("%d %b %Y %I:%M:%S %p","%d %b %Y %I:%M %p","%d %b %Y"):
+        try: return datetime.strptime(f"{d} {t}".strip() if "%I" in fmt else d.strip(),fmt)
+        except ValueError: pass
     return None
 
+def write_feed(gm=None, log=print, out_dir=None):
+    """Write latest.json, days/YYYY-MM-DD.json and manifest.json (content hash per file) from the store.
+    Unchanged files are left alone, so index.html only downloads partitions whose hash moved."""
+    out_dir=out_dir if out_dir is not None else FEED_DIR
+    if not out_dir or not STORE: return
+    if gm and not STORE.meta("sheet_rows_at"):
+        try:
+            for ws in gm.archive_tabs(): STORE.import_sheet_rows(ws.get_all_values()[1:],tab=ws.title)
+            STORE.import_sheet_rows(gm.worksheet.get_all_values()[1:]); log("  ✓ Sheet history loaded into the store")
+        except Exception as e: log(f"  ✗ Sheet history import failed: {e}")
+    days=defaultdict(list); dated=[]
+    for d,t,c,sj,x,m,l,n,u in STORE.q(f"SELECT {Store.COLS} FROM rows WHERE company IS NOT NULL AND company!='' ORDER BY rowid"):
+        it={"d":d,"t":t,"c":c,"s":sj,"x":x or "","m":m or "","l":l or "","n":n or 0,"g":feed_group(sj),"u":u}
+        when=_row_when(d or "",t or ""); days[when.strftime("%Y-%m-%d") if when else "undated"].append(it); dated.append((when or datetime.min,it))
+    dated.sort(key=lambda e:e[0],reverse=True)
+    try:
+        with open(os.path.join(out_dir,"manifest.json")) as f: old=json.load(f)
+    except (OSError,ValueError): old={}
+    def emit(rel, rows):
+        data=json.dumps(rows,separators=(",",":"),ensure_ascii=False).encode(); h=hashlib.sha1(data).hexdigest()[:12]
+        prev=(old.get("days",{}).get(rel[5:-5]) if rel.startswith("days/") else old.get("latest")) or {}
+        p=os.path.join(out_dir,rel)
+        if prev.get("h")!=h or not os.path.exists(p):
+            os.makedirs(os.path.dirname(p),exist_ok=True)
+            with open(p+".tmp","wb") as f: f.write(data)
+            os.replace(p+".tmp",p)
+        return {"f":rel,"h":h,"n":len(rows)}
+    man={"latest":emit("latest.json",[it for _,it in dated[:FEED_LATEST]]),
+         "days":{day:emit(f"days/{day}.json",rows) for day,rows in sorted(days.items())}}
+    if {k:man[k] for k in ("latest","days")}!={k:old.get(k) for k in ("latest","days")}:
+        man["generated"]=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        with open(os.path.join(out_dir,"manifest.json"),"w") as f: json.dump(man,f,separators=(",",":"))
+        log(f"  ✓ Feed updated ({len(days)} day partition(s))")
+
+# ─── SEARCH ───────────────────────────────────────────────────────────
+def _fts_quote(s): return " ".join('"'+w.replace('"','""')+'"' for w in s.split())
+
+def search(query="", company=None, category=None, since=None, until=None, limit=50):
+    """Full-text search of the store's summaries and PDF text. `query` takes FTS5 syntax (words, "phrases", OR,
+    NOT, prefix*); company/category must contain the given words; since/until are ISO date prefixes ("2025",
+    "2025-03"), inclusive. Returns row dicts, best match first (newest first without any words)."""
+    if not STORE or not STORE.fts: raise RuntimeError("Search needs the local store (CSE_DB) and SQLite with FTS5")
+    if not STORE.meta("search_at"): STORE.index(); STORE.set_meta("search_at",time.time())  # rows stored before the index existed
+    def run(q, co, cat):
+        m=" AND ".join([f"({q})"]*bool(q)+[f"company:({co})"]*bool(co)+[f"category:({cat})"]*bool(cat))
+        return STORE.q("SELECT search.day, rows.time, rows.company, rows.subject, rows.summary, rows.pdf_link, rows.base, "
+            f"snippet(search,-1,'[',']','…',12) FROM search JOIN rows ON rows.rowid=search.rowid WHERE {'search MATCH ? AND ' if m else ''}"
+            "(? IS NULL OR search.day>=?) AND (? IS NULL OR substr(search.day,1,length(?))<=?) "
+            f"ORDER BY {'rank' if m else 'search.day DESC'} LIMIT ?",[m]*bool(m)+[since,since,until,until,until,limit])
+    try: hits=run(query,company,category)
+    except sqlite3.OperationalError: hits=run(*(_fts_quote(x) if x else x for x in (query,company,category)))  # not valid FTS5 syntax: plain words
+    return [dict(zip(("date","time","company","category","summary","pdf_link","ukey","snippet"),h)) for h in hits]
+
+def run_search(argv, log=print):
+    opt=lambda f,d=None: argv[argv.index(f)+1] if f in argv[:-1] and not argv[argv.index(f)+1].startswith("--") else d
+    t0=time.perf_counter()
+    try: hits=search(opt("--search",""),company=opt("--company"),category=opt("--category"),since=opt("--from"),until=opt("--to"),limit=int(opt("--limit",30)))
+    except RuntimeError as e: log(f"✗ {e}"); return 1
+    for h in hits: log(f"{h['date']}  {h['company'][:40]:<40} {h['category'][:40]}\n    {' '.join(h['snippet'].split())}"+(f"\n    {h['pdf_link']}" if h['pdf_link'] else ""))
+    log(f"{len(hits)} hit(s) in {(time.perf_counter()-t0)*1000:.0f} ms"); return 0
+
 # ─── CORE ENGINE ──────────────────────────────────────────────────────
 def process_one_item(gm, item, existing_keys, log=print):
+    return write_item(gm, prepare_item(item, existing_keys, log=log), existing_keys, log=log)
+
+def prepare_item(item, existing_keys, log=print):
+    """Fetch detail, PDF text and summary for one announcement. Returns (ukey, rows, ann_id), or None if already in the sheet."""
+    ctx=gather_item(item,existing_keys,log=log)
+    return finish_item(ctx,log=log) if ctx else None
+
+def gather_item(item, existing_keys, log=print):
+    """Network stage: detail, structured summary, else the PDF/description text for the AI. None if already in the sheet."""
     ann_id=item.get("announcementId"); co=item.get("company",""); cat=item.get("announcementCategory","")
     ds=item.get("dateOfAnnouncement",""); rem=item.get("remarks") or ""; cr=item.get("createdDate",0)
     try: dt=datetime.fromtimestamp(cr/1000); ts=dt.strftime("%I:%M:%S %p"); ds=ds or dt.strftime("%d %b %Y").upper()
     except: ts=""
     ukey=f"{ds}|{ts}|{co}"
-    if ukey in existing_keys or any(k.startswith(ukey) for k in existing_keys): return 0
+    if ukey in existing_keys: return None
     log(f"  {co[:40]} — {cat}")
-    detail=get_detail(ann_id); pdfs=[]
+    detail=get_detail(ann_id,cat); pdfs=[]
     if detail:
         for doc in detail.get("reqAnnouncementDocs",[]):
             fu=doc.get("fileUrl",""); bu=doc.get("baseUrl",CSE_CDN)
@@ -414,142 +1438,424 @@ def process_one_item(gm, item, existing_keys, log=print):
     # Summary
     summary=None
     if detail:
-        summary=build_structured_summary(detail)
+        summary=build_structured_summary(detail,cat)
         if summary: log(f"    ✓ Structured")
+    ai_text=ai_src=None
     if not summary and pdfs:
-        pt=download_pdf_text(pdfs[0].replace(CSE_CDN,"").replace("https://cdn.cse.lk/",""),log=log)
-        if pt:
-            summary=ai_summarize(pt,co,cat,log=log)
-            if summary: log(f"    ✓ AI summary")
+        ai_text=download_pdf_text(pdfs[0].replace(CSE_CDN,"").replace("https://cdn.cse.lk/",""),log=log); ai_src="pdf"
     if not summary and detail and not pdfs:
         # No PDF — try AI on description/remarks text
         base=detail.get("reqBaseAnnouncement",{})
         desc_text=(base.get("description","") or "") + " " + (base.get("remarks","") or "")
         desc_text=desc_text.strip()
-        if desc_text and len(desc_text)>30:
-            summary=ai_summarize(desc_text,co,cat,log=log)
-            if summary: log(f"    ✓ AI summary (from description)")
+        if desc_text and len(desc_text)>30: ai_text=desc_text; ai_src="description"
+    if STORE:
+        STORE.put_announcement(ann_id,ukey,item,detail)
+        for i,link in enumerate(pdfs): STORE.put_pdf(link,ann_id,ai_text if i==0 and ai_src=="pdf" else None)
+    return dict(ukey=ukey,ann_id=ann_id,ds=ds,ts=ts,co=co,cat=cat,rem=rem,detail=detail,pdfs=pdfs,summary=summary,ai_text=ai_text,ai_src=ai_src)
+
+def _desc_fallback(co, detail):
+    """Last-resort summary from the detail's description/remarks, or None if there is too little of it."""
+    base=(detail or {}).get("reqBaseAnnouncement",{})
+    desc_text=re.sub(r'\s+',' ',(base.get("description","") or "")+" "+(base.get("remarks","") or "")).strip()
+    if len(desc_text)<=20: return None
+    return f"{co}: {desc_text[:497]+'...' if len(desc_text)>500 else desc_text}"
+
+def finish_item(ctx, log=print, ai=None):
+    """AI stage and fallbacks, then the sheet rows. `ai` is a summary already produced by ai_summarize_batch."""
+    ukey,ds,ts,co,cat,rem,detail,pdfs,summary=(ctx[k] for k in ("ukey","ds","ts","co","cat","rem","detail","pdfs","summary"))
+    src="structured" if summary else None; deferred=False
+    if not summary and ctx["ai_text"]:
+        summary=ai or ai_summarize(ctx["ai_text"],co,cat,log=log)
+        if summary: src="ai_batch" if ai else "ai"; log("    ✓ AI summary"+(" (from description)" if ctx["ai_src"]=="description" else "")+(" (batch)" if ai else ""))
+        else: deferred=llm_limited()
     if not summary and detail:
         # Last resort: use raw description/remarks from API
-        base=detail.get("reqBaseAnnouncement",{})
-        desc_text=(base.get("description","") or "") + " " + (base.get("remarks","") or "")
-        desc_text=re.sub(r'\s+',' ',desc_text).strip()
-        if desc_text and len(desc_text)>20:
-            if len(desc_text)>500: desc_text=desc_text[:497]+"..."
-            summary=f"{co}: {desc_text}"
-            log(f"    ✓ Description fallback")
-    if not summary: summary=f"{co} — {cat}."; log(f"    ⚠ Fallback")
-    # Write
-    w=0
+        summary=_desc_fallback(co,detail)
+        if summary: src="description"; log("    ✓ Description fallback")
+    if not summary: summary=f"{co} — {cat}."; src="fallback"; log(f"    ⚠ Fallback")
+    METRICS.inc("summaries",source=src)
+    if deferred: defer_summary(ukey,ctx["ai_text"],co,cat,summary); log("    ~ AI providers rate limited, summary queued for upgrade")
+    if len(pdfs)>1:
+        return ukey,[[ds,ts,co,cat,f"PDF {pi+1} of {len(pdfs)}",summary,link,len(pdfs),f"{ukey}|PDF{pi+1}"] for pi,link in enumerate(pdfs)],ctx["ann_id"]
+    return ukey,[[ds,ts,co,cat,rem[:200],summary,pdfs[0] if pdfs else "",len(pdfs),ukey]],ctx["ann_id"]
+
+def write_item(gm, prepared, existing_keys, log=print):
+    if not prepared: return 0
+    ukey,rows,ann_id=prepared
+    if ukey in existing_keys: log("    ~ Duplicate"); return 0
+    write_rows(gm,rows,ann_id,log=log)
+    for row in rows: existing_keys.add(row[8])
+    log("    ✓ Queued")
+    return len(rows)
+
+def process_items(gm, items, existing_keys, log=print, running_check=None, progress=None):
+    tot=0
+    def emit(i, n, lines, res):
+        nonlocal tot
+        if progress: progress(i+1,n)
+        log(f"\n[{i+1}/{n}]")
+        for l in lines: log(l)
+        tot+=write_item(gm,res,existing_keys,log=log)
+    run_stages(items,lambda it,lg: gather_item(it,existing_keys,log=lg),finish_item,emit,log=log,running_check=running_check)
+    return tot
+
+def run_stages(items, gather, finish, emit, log=print, running_check=None):
+    """gather(item, log) → ctx on a worker pool (throttled per service by LIMITS); ctxs with "ai_text" but no
+    "summary" are AI-summarized LLM_BATCH_SIZE at a time; finish(ctx, log, ai) runs on a second pool;
+    emit(i, n, log_lines, result) is called in input order."""
+    stopped=lambda: running_check is not None and not running_check()
+    def g(it):
+        lines=[]
+        if stopped(): return lines,None
+        try: return lines,gather(it,lines.append)
+        except Exception as e: lines.append(f"    ✗ {e}"); return lines,None
+    def f(lines, ctx, ai):
+        try: return finish(ctx,lines.append,ai) if ctx else None
+        except Exception as e: lines.append(f"    ✗ {e}"); return None
+    n=len(items); step=max(1,LLM_BATCH_SIZE)
+    def depth(**q):  # items waiting per stage, for the GUI's stats panel and the metrics report
+        for k,v in q.items(): METRICS.gauge("queue",v,stage=k)
+    gx=ThreadPoolExecutor(max_workers=PIPELINE_WORKERS); fx=ThreadPoolExecutor(max_workers=PIPELINE_WORKERS)
     try:
-        if len(pdfs)>1:
-            for pi,link in enumerate(pdfs):
-                key=f"{ukey}|PDF{pi+1}"
-                gm.worksheet.append_row([ds,ts,co,cat,f"PDF {pi+1} of {len(pdfs)}",summary,link,len(pdfs),key],value_input_option='RAW')
-                existing_keys.add(key); w+=1
-        else:
-            gm.worksheet.append_row([ds,ts,co,cat,rem[:200],summary,pdfs[0] if pdfs else "",len(pdfs),ukey],value_input_option='RAW')
-            existing_keys.add(ukey); w=1
-        log(f"    ✓ Written")
-    except Exception as e: log(f"    ✗ Write error: {e}")
-    return w
+        gathered=[gx.submit(g,it) for it in items]
+        for c0 in range(0,n,step):
+            if stopped(): break
+            chunk=[fu.result() for fu in gathered[c0:c0+step]]; pre=[None]*len(chunk)
+            need=[j for j,(_,ctx) in enumerate(chunk) if ctx and not ctx["summary"] and ctx["ai_text"]]
+            depth(gather=sum(not fu.done() for fu in gathered),ai=len(need) if len(need)>1 else 0)
+            if len(need)>1:
+                for j,sm in zip(need,ai_summarize_batch([(chunk[j][1]["ai_text"],chunk[j][1]["co"],chunk[j][1]["cat"]) for j in need],log=log)): pre[j]=sm
+            finished=[fx.submit(f,lines,ctx,pre[j]) for j,(lines,ctx) in enumerate(chunk)]; depth(ai=0)
+            for j,fu in enumerate(finished):
+                if stopped(): break
+                res=fu.result(); depth(finish=sum(not x.done() for x in finished[j+1:])); emit(c0+j,n,chunk[j][0],res)
+    finally: gx.shutdown(wait=True,cancel_futures=True); fx.shutdown(wait=True,cancel_futures=True); depth(gather=0,ai=0,finish=0)
 
-def fix_old_summaries(gm, items, log=print, running_check=None):
+def fix_old_summaries(gm, items, log=print, running_check=None, state=None):
+    """Re-summarize rows whose AI Summary is empty or a fallback, FIX_MAX_ROWS per run starting after the
+    saved cursor. Reads only the columns it needs, of the recent tab only, and writes all repairs in one batch_update."""
     log("━"*50); log("CHECKING OLD SUMMARIES..."); log("━"*50)
-    all_rows=gm.worksheet.get_all_values()
-    needs=[(i,r) for i,r in enumerate(all_rows[1:],start=2) if not(r[5] if len(r)>5 else "") or is_fallback(r[5] if len(r)>5 else "")]
-    if not needs: log("  All OK"); return
-    log(f"  {len(needs)} need fixing")
-    for idx,(rn,row) in enumerate(needs):
-        if running_check and not running_check(): break
-        co=row[2] if len(row)>2 else ""; subj=row[3] if len(row)>3 else ""; pl=row[6] if len(row)>6 else ""
-        log(f"  [{idx+1}/{len(needs)}] {co[:40]} — {subj}")
-        s=None
-        for it in items:
-            if it.get("company","").strip()==co.strip() and it.get("announcementCategory","").strip()==subj.strip():
-                d=get_detail(it.get("announcementId"))
-                if d: s=build_structured_summary(d)
-                if s: log(f"    ✓ Structured")
-                break
-        if not s and pl:
-            url=None; m=re.search(r'HYPERLINK\("([^"]+)"',pl)
-            if m: url=m.group(1)
-            elif pl.startswith("http"): url=pl
-            if url:
-                pt=download_pdf_text(url.replace(CSE_CDN,"").replace("https://cdn.cse.lk/",""),log=log)
-                if pt: s=ai_summarize(pt,co,subj,log=log)
-                if s: log(f"    ✓ AI")
-        if not s and not pl:
+    own=state is None; state=load_state() if own else state
+    with METRICS.span("fix",step="read"): cd,fg,ks=gm.worksheet.batch_get(["C2:D","F2:G","I2:I"])  # company, subject | summary, link | key
+    cell=lambda r,i: r[i] if len(r)>i else ""
+    at=lambda rs,i: rs[i] if i<len(rs) else []
+    # Description fallbacks read like structured summaries ("{co}: …"): they are recognized by rebuilding
+    # them from the detail the store kept for the row's announcement.
+    maybe={i:_PDF_SUFFIX.sub('',cell(at(ks,i),0)) for i in range(len(fg)) if cell(at(cd,i),0) and cell(at(fg,i),0).startswith(cell(at(cd,i),0)+": ")}
+    details=dict(STORE.q_in("SELECT ukey,detail FROM announcements WHERE detail IS NOT NULL AND ukey IN ({})",set(maybe.values()))) if STORE and maybe else {}
+    def stale(i, co, subj, s):
+        if is_fallback(s,co,subj): return True
+        d=details.get(maybe.get(i)); return bool(d) and s==_desc_fallback(co,json.loads(d))
+    rows=[]
+    for i in range(max(len(cd),len(fg))):
+        a=at(cd,i); b=at(fg,i)
+        if stale(i,cell(a,0),cell(a,1),cell(b,0)) and (cell(a,0) or cell(b,1)): rows.append((i+2,cell(a,0),cell(a,1),cell(b,1)))
+    if not rows: log("  All OK"); return
+    cur=state.get("fix_cursor",0)
+    todo=([r for r in rows if r[0]>cur]+[r for r in rows if r[0]<=cur])[:FIX_MAX_ROWS]
+    log(f"  {len(rows)} need fixing, {len(todo)} this run (from row {todo[0][0]})")
+    by_key=defaultdict(list)
+    for it in items: by_key[(it.get("company","").strip(),it.get("announcementCategory","").strip())].append(it)
+    def gather(row, lg):
+        rn,co,subj,pl=row
+        lg(f"  [row {rn}] {co[:40]} — {subj}")
+        match=by_key.get((co.strip(),subj.strip()))
+        d=get_detail(match[0].get("announcementId"),subj) if match else None
+        ctx=dict(co=co,cat=subj,summary=build_structured_summary(d,subj) if d else None,ai_text=None)
+        if ctx["summary"]: lg("    ✓ Structured")
+        elif pl:
+            m=re.search(r'HYPERLINK\("([^"]+)"',pl); url=m.group(1) if m else pl if pl.startswith("http") else None
+            if url: ctx["ai_text"]=download_pdf_text(url.replace(CSE_CDN,"").replace("https://cdn.cse.lk/",""),log=lg)
+        elif d:
             # No PDF — try AI on description from API
-            for it in items:
-                if it.get("company","").strip()==co.strip() and it.get("announcementCategory","").strip()==subj.strip():
-                    d=get_detail(it.get("announcementId"))
-                    if d:
-                        base=d.get("reqBaseAnnouncement",{})
-                        desc_text=(base.get("description","") or "") + " " + (base.get("remarks","") or "")
-                        desc_text=desc_text.strip()
-                        if desc_text and len(desc_text)>30:
-                            s=ai_summarize(desc_text,co,subj,log=log)
-                            if s: log(f"    ✓ AI (from description)")
-                    break
-        if s:
-            try: gm.worksheet.update_cell(rn,6,s)
-            except Exception as e: log(f"    ✗ {e}")
-        else: log(f"    ~ Skip")
-        if idx<len(needs)-1: time.sleep(SUMMARY_DELAY)
+            base=d.get("reqBaseAnnouncement",{})
+            desc_text=((base.get("description","") or "")+" "+(base.get("remarks","") or "")).strip()
+            if len(desc_text)>30: ctx["ai_text"]=desc_text; ctx["from_desc"]=True
+        return ctx
+    def finish(ctx, lg, ai):
+        s=ctx["summary"]
+        if not s and ctx["ai_text"]:
+            s=ai or ai_summarize(ctx["ai_text"],ctx["co"],ctx["cat"],log=lg)
+            if s: lg("    ✓ AI"+(" (from description)" if ctx.get("from_desc") else "")+(" (batch)" if ai else ""))
+        if not s: lg("    ~ Skip")
+        return s
+    fixes=[]
+    def emit(i, n, lines, res):
+        for l in lines: log(l)
+        if res: fixes.append((todo[i][0],res))
+        state["fix_cursor"]=todo[i][0]
+    try:
+        with METRICS.span("fix",step="repair"): run_stages(todo,gather,finish,emit,log=log,running_check=running_check)
+    finally:  # also on Stop (Cancelled): repairs made so far are written and the cursor kept
+        if fixes: gm.update_summaries(fixes)
+        METRICS.inc("fix_rows",n=len(todo),result="tried"); METRICS.inc("fix_rows",n=len(fixes),result="fixed")
+        log(f"  {len(fixes)} summary fix(es)")
+        if own: save_state(state)
+
+UPGRADES = []; _UPGRADES_LOCK = threading.Lock()  # deferred AI summaries not yet moved into the run state
+
+def defer_summary(ukey, text, company, subject, fallback):
+    """Queue a row that was written with `fallback` because every AI provider was out of rotation."""
+    cleaned=_llm_input(text)
+    if not cleaned: return
+    with _UPGRADES_LOCK: UPGRADES.append({"ukey":ukey,"text":cleaned,"co":company,"cat":subject,"was":fallback,"t":time.time()})
+    METRICS.inc("ai_deferred")
+
+def _rows_by_base(gm, bases):
+    """base ukey → [(sheet row, current summary)] for the given bases."""
+    out=defaultdict(list)
+    if STORE:
+        bases=list(bases)
+        for i in range(0,len(bases),500):
+            chunk=bases[i:i+500]
+            for b,rn,sm in STORE.q(f"SELECT base,sheet_row,summary FROM rows WHERE sheet_row IS NOT NULL AND tab IS NULL AND base IN ({','.join('?'*len(chunk))})",chunk):
+                out[b].append((rn,sm))
+        return out
+    f,k=gm.worksheet.batch_get(["F2:F","I2:I"])
+    for i,r in enumerate(k):
+        b=_PDF_SUFFIX.sub('',r[0]) if r else ""
+        if b in bases: out[b].append((i+2,f[i][0] if i<len(f) and f[i] else ""))
+    return out
+
+def upgrade_summaries(gm, state, log=print):
+    """AI summaries for rows queued by defer_summary, once a provider is back. Entries wait in state["upgrades"]
+    between runs; a row is only overwritten while it still holds the fallback it was written with."""
+    with _UPGRADES_LOCK: q=state.get("upgrades",[])+UPGRADES; UPGRADES.clear()
+    if not q: return
+    if llm_limited(): state["upgrades"]=q[-UPGRADE_MAX:]; log(f"  {len(q)} AI upgrade(s) waiting for a provider"); return
+    log("━"*50); log(f"UPGRADING {len(q)} FALLBACK SUMMARIES..."); log("━"*50)
+    where=_rows_by_base(gm,{u["ukey"] for u in q}); left=[]; cells=[]
+    for u in q:
+        if u["ukey"] not in where:
+            if time.time()-u.get("t",0)<86400: left.append(u)  # not synced yet; give up after a day
+            continue
+        rows=[rn for rn,cur in where[u["ukey"]] if cur==u["was"]]
+        if not rows: continue
+        if llm_limited(): left.append(u); continue
+        s=ai_summarize(u["text"],u["co"],u["cat"],log=log)
+        if s: cells+=[(rn,s) for rn in rows]; log(f"  ✓ {u['co'][:40]} — {u['cat']}")
+        elif llm_limited(): left.append(u)
+    if cells: gm.update_summaries(cells); METRICS.inc("ai_upgraded",n=len(cells))
+    state["upgrades"]=left[-UPGRADE_MAX:]
+    log(f"  {len(cells)} row(s) upgraded, {len(left)} still queued")
 
 # ═══════════════════════════════════════════════════════════════════════
 #  HEADLESS
 # ═══════════════════════════════════════════════════════════════════════
-def run_headless():
+def run_headless(full=False):
     start=time.time(); hl=lambda m:print(f"[{datetime.now().strftime('%H:%M:%S')}] {m}")
     hl("="*50); hl("CSE TRACKER v9 — Headless"); hl("="*50)
-    gm=GoogleManager(log_callback=hl); ek=gm.get_existing_keys(); hl(f"  Existing: {len(ek)}")
-    items=fetch_announcements(log=hl)
-    if not items: hl("No announcements"); return
+    try: sync_once({} if full else load_state(),hl)
+    finally: METRICS.write()
+    hl("="*50); hl(f"✓ DONE in {time.time()-start:.1f}s"); hl("="*50)
+
+def check(log=print):
+    """Anything new since the last saved run? One approvedAnnouncement request (stdlib urllib, so no heavy
+    imports) compared with the run state. Returns 1 if so or if the check failed, 0 if not; financial
+    reports are not looked at, so a scheduler should still do a full run now and then."""
+    import urllib.request
+    try:
+        req=urllib.request.Request(CSE_API+"approvedAnnouncement",data=b"",headers=FORM_HEADERS,method="POST")
+        with urllib.request.urlopen(req,timeout=sum(HTTP_TIMEOUTS["list"])) as r: items=json.load(r).get("approvedAnnouncements",[])
+    except Exception as e: log(f"✗ Check failed: {e}"); return 1
+    fresh,_=feed_delta(load_state(),"announcements",items[:MAX_DISCLOSURES])
+    log(f"{len(fresh)} new announcement(s) since the last run"); return 1 if fresh else 0
+
+def sync_once(state, log, gm=None, ek=None, fix=True):
+    """Fetch both feeds and process what changed since `state`, which is updated and saved once writes flush.
+    Opens a GoogleManager only when there is work. Returns (gm, number of changed items)."""
+    items=fetch_announcements(log=log); fr_items=fetch_financial_reports(log=log)
+    fresh,ann_entry=feed_delta(state,"announcements",items); fr_fresh,fin_entry=feed_delta(state,"financials",fr_items)
+    if state and not fresh and not fr_fresh:
+        log("  No change since last run")
+        if (state.get("upgrades") or UPGRADES) and not llm_limited():
+            gm=gm or GoogleManager(log_callback=log); upgrade_summaries(gm,state,log=log); save_state(state)
+        return gm,0
+    METRICS.inc("fresh_items",n=len(fresh),feed="announcements"); METRICS.inc("fresh_items",n=len(fr_fresh),feed="financials")
+    log(f"  Since last run: {len(fresh)} announcement(s), {len(fr_fresh)} financial report(s)")
+    gm=gm or GoogleManager(log_callback=log)
+    try: _headless_run(gm,log,items,fresh,fr_fresh,ek=ek,fix=fix,state=state); upgrade_summaries(gm,state,log=log); gm.roll_over(state)
+    finally: gm.flush(); flush_sinks(log)
+    try: write_feed(gm,log=log)
+    except Exception as e: log(f"  ✗ Feed error: {e}")
+    if not gm.pending():
+        state.update({k:v for k,v in (("announcements",ann_entry),("financials",fin_entry)) if v}); save_state(state)
+    return gm,len(fresh)+len(fr_fresh)
+
+def in_cse_hours(now=None):
+    """Weekday 08:30–17:30 Colombo time: trading hours plus the pre-open and after-close disclosure rush."""
+    t=now or datetime.now(CSE_TZ)
+    return t.weekday()<5 and 8*60+30<=t.hour*60+t.minute<17*60+30
+
+def run_watch():
+    hl=lambda m:print(f"[{datetime.now().strftime('%H:%M:%S')}] {m}",flush=True); stop=threading.Event()
+    def on_signal(*_): hl("⏹ Stopping..."); stop.set()
+    signal.signal(signal.SIGINT,on_signal); signal.signal(signal.SIGTERM,on_signal)
+    hl("="*50); hl("CSE TRACKER v9 — Watch"); hl("="*50)
+    state=load_state(); gm=GoogleManager(log_callback=hl)
+    last_fix=time.time(); wait=None
+    try:
+        while not stop.is_set():
+            fix=time.time()-last_fix>=WATCH_FIX_SECS
+            try: _,n=sync_once(state,hl,gm=gm,fix=fix)  # keys are re-read only by polls that find something new
+            except Exception as e: hl(f"✗ Poll error: {e}"); n=0; METRICS.inc("poll_errors")
+            METRICS.inc("polls"); METRICS.write()
+            if n and fix: last_fix=time.time()
+            base=WATCH_MIN_SECS if in_cse_hours() else WATCH_IDLE_SECS
+            wait=base if n or wait is None else min(max(wait*2,base),WATCH_MAX_SECS)
+            hl(f"  Next poll in {wait:.0f}s"); stop.wait(wait)
+    finally: gm.flush(); close_browser(); hl("✓ Watch stopped")
+
+def _headless_run(gm, hl, items, fresh, fr_items, ek=None, fix=True, state=None):
+    if ek is None: ek=gm.get_existing_keys(); hl(f"  Existing: {len(ek)}")
+    if not items: hl("No announcements")
     new=[]
     skipped=0
-    for it in items:
+    for it in fresh:
         co=it.get("company",""); ds=it.get("dateOfAnnouncement",""); cr=it.get("createdDate",0)
         try: dt=datetime.fromtimestamp(cr/1000); ts=dt.strftime("%I:%M:%S %p")
         except: ts=""
         uk=f"{ds}|{ts}|{co}"
-        if uk not in ek and not any(k.startswith(uk) for k in ek): new.append(it)
+        if uk not in ek: new.append(it)
         else: skipped+=1
     hl(f"  {len(new)} NEW, {skipped} skipped (already exist)")
     hl(f"  {len(new)} NEW")
     if new:
-        hl("─"*40); hl("PROCESSING ROW BY ROW"); hl("─"*40)
-        tot=0
-        for i,it in enumerate(new):
-            hl(f"\n[{i+1}/{len(new)}]")
-            try: tot+=process_one_item(gm,it,ek,log=hl)
-            except Exception as e: hl(f"    ✗ {e}")
-            if i<len(new)-1: time.sleep(SUMMARY_DELAY)
+        hl("─"*40); hl("PROCESSING"); hl("─"*40)
+        tot=process_items(gm,new,ek,log=hl)
         hl(f"\n  Total: {tot} rows")
     else: hl("  Up to date!")
     # Financial reports
     hl("─"*40); hl("FINANCIAL REPORTS"); hl("─"*40)
-    fr_items=fetch_financial_reports(log=hl)
     if fr_items:
         fr_added=0
         for it in fr_items:
             try: fr_added+=process_financial_report(gm,it,ek,log=hl)
             except Exception as e: hl(f"    ✗ {e}")
         hl(f"  Financial reports: {fr_added} added")
-    fix_old_summaries(gm,items,log=hl)
-    hl("="*50); hl(f"✓ DONE in {time.time()-start:.0f}s"); hl("="*50)
+    gm.flush()
+    if items and fix: fix_old_summaries(gm,items,log=hl,state=state)
+
+# ─── BACKFILL ─────────────────────────────────────────────────────────
+_BF_KEYS = None
+
+def _cse_day(ms):
+    return datetime.fromtimestamp(ms/1000).date() if ms else None
+
+def fetch_day(day):
+    """Announcements and financial reports the list endpoints return for one day, filtered to that day
+    (the endpoints are not documented to honour the date fields, so anything else they return is dropped).
+    Raises if an endpoint returns items but none on that day: it ignored BACKFILL_FORM, and the day must
+    not be checkpointed as done."""
+    form={k:day.strftime(v) for k,v in BACKFILL_FORM.items()}; out=[]
+    for ep,field,feed in (("approvedAnnouncement","approvedAnnouncements","announcements"),
+                          ("getFinancialAnnouncement","reqFinancialAnnouncemnets","financials")):
+        r=http("POST","cse",CSE_API+ep,"list",data=form,headers=FORM_HEADERS); r.raise_for_status()
+        got=r.json().get(field) or []; hit=[it for it in got if _cse_day(FEEDS[feed][1](it))==day]
+        if got and not hit: raise ValueError(f"{ep} returned {len(got)} item(s), none on {day}; it looks like it ignores {', '.join(form)} (see BACKFILL_FORM)")
+        out.append(hit)
+    return out
+
+def _backfill_init(keys, procs):
+    """Worker process setup: the sheet's keys for dedup, and a 1/procs share of every rate limit."""
+    global _BF_KEYS
+    _BF_KEYS=KeyIndex(keys)
+    for l in LIMITS.values(): l.rate/=procs; l.burst=max(1,l.burst//procs); l.tokens=min(l.tokens,l.burst)
+
+def _backfill_day(day):
+    """Worker: fetch one day and prepare its announcements. Returns (day, log lines, prepared items,
+    financial report items, deferred AI upgrades, ok); ok is False if anything failed, so the day is not
+    checkpointed. Upgrades queued by defer_summary live in this process's UPGRADES, so they are handed back."""
+    lines=[]; prepared=[]; failed=[]
+    try: items,fins=fetch_day(day)
+    except Exception as e: return day,[f"  ✗ {day}: {e}"],[],[],[],False
+    lines.append(f"  {day}: {len(items)} announcement(s), {len(fins)} financial report(s)")
+    def guard(fn):
+        def run(*a):
+            try: return fn(*a)
+            except Exception: failed.append(1); raise
+        return run
+    def emit(i, n, lg, res):
+        lines.extend(lg)
+        if res: prepared.append(res)
+    run_stages(items,guard(lambda it,lg: gather_item(it,_BF_KEYS,log=lg)),guard(finish_item),emit,log=lines.append)
+    with _UPGRADES_LOCK: ups=UPGRADES[:]; UPGRADES.clear()
+    return day,lines,prepared,fins,ups,not failed
+
+BACKFILL_USAGE = "Usage: python cse_tracker_v9.py --backfill FROM TO --experimental   (dates as YYYY-MM-DD, FROM on or before TO)"
+BACKFILL_EXPERIMENTAL = ("--backfill is experimental: CSE does not document date fields for its list endpoints, and the ones it sends\n"
+    f"(BACKFILL_FORM: {', '.join(BACKFILL_FORM)}) are unconfirmed. If the endpoints ignore them, every historic day fails\n"
+    "(nothing is written or checkpointed). Add --experimental to run it anyway.")
+
+def run_backfill(start="", end="", workers=BACKFILL_WORKERS):
+    """Process every day in [start, end] (YYYY-MM-DD), one day per worker process; rows are written from this
+    process in one append per day. Finished days are checkpointed in the run state, so rerunning the same
+    range after an interruption resumes where it stopped. Rows written with a fallback while the AI providers
+    were out of rotation are upgraded at the end, or left in the state's upgrade queue for the next run.
+    Returns the exit code: 2 for bad arguments, 1 if any day failed."""
+    try: d0,d1=(datetime.strptime(d,"%Y-%m-%d").date() for d in (start,end))
+    except ValueError: print(BACKFILL_USAGE); return 2
+    if d0>d1: print(BACKFILL_USAGE); return 2
+    t0=time.time(); hl=lambda m:print(f"[{datetime.now().strftime('%H:%M:%S')}] {m}",flush=True)
+    hl("="*50); hl("CSE TRACKER v9 — Backfill"); hl("="*50)
+    state=load_state(); bf=state.get("backfill") or {}
+    if bf.get("range")!=[start,end]: bf={"range":[start,end],"done":[]}
+    done=set(bf["done"]); days=[d for d in (d0+timedelta(days=i) for i in range((d1-d0).days+1)) if d.isoformat() not in done]
+    hl(f"  {start} → {end}: {len(days)} day(s) to do, {len(done)} already done")
+    if not days: return 0
+    gm=GoogleManager(log_callback=hl); ek=gm.get_existing_keys(); hl(f"  Existing: {len(ek)}")
+    import multiprocessing
+    ex=ProcessPoolExecutor(max_workers=min(workers,len(days)),mp_context=multiprocessing.get_context("spawn"),
+                           initializer=_backfill_init,initargs=(list(ek),min(workers,len(days))))
+    added=0; failed=[]
+    try:
+        for day,lines,prepared,fins,ups,ok in ex.map(_backfill_day,days):
+            for l in lines: hl(l)
+            with _UPGRADES_LOCK: UPGRADES.extend(ups)
+            for p in prepared: added+=write_item(gm,p,ek,log=hl)
+            for it in fins:
+                try: added+=process_financial_report(gm,it,ek,log=hl)
+                except Exception as e: hl(f"    ✗ {e}"); ok=False
+            flush_sinks(hl)
+            if gm.flush() and ok:
+                gm.roll_over(state); bf["done"].append(day.isoformat()); state["backfill"]=bf; save_state(state)
+            else: failed.append(day.isoformat())
+        gm.flush(); upgrade_summaries(gm,state,log=hl)
+    except KeyboardInterrupt: hl("⏹ Interrupted — rerun the same range to resume")
+    finally:
+        ex.shutdown(wait=False,cancel_futures=True); gm.flush()
+        with _UPGRADES_LOCK: state["upgrades"]=(state.get("upgrades",[])+UPGRADES)[-UPGRADE_MAX:]; UPGRADES.clear()
+        save_state(state); METRICS.write()
+    try: write_feed(gm,log=hl)
+    except Exception as e: hl(f"  ✗ Feed error: {e}")
+    hl("="*50); hl(f"{'✗' if failed else '✓'} Backfill: {added} row(s) in {time.time()-t0:.1f}s"
+        +(f", {len(failed)} day(s) failed and left for a rerun ({failed[0]} …)" if failed else "")); hl("="*50)
+    return 1 if failed else 0
 
 # ═══════════════════════════════════════════════════════════════════════
 #  GUI
 # ═══════════════════════════════════════════════════════════════════════
+def has_display():
+    """A GUI may start: tkinter is installed and, outside macOS/Windows, X11 or Wayland is set. Opens no window;
+    run_gui still falls back to headless if the display turns out to be unusable."""
+    if sys.platform not in ("darwin","win32") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")): return False
+    import importlib.util
+    return importlib.util.find_spec("tkinter") is not None
+
 def run_gui():
-    import tkinter as tk
+    import tkinter as tk, webbrowser
     from tkinter import messagebox, scrolledtext
+    try: root=tk.Tk()
+    except tk.TclError as e: print(f"✗ GUI unavailable ({e}), running headless"); return run_headless()
+    global INTERRUPTIBLE; INTERRUPTIBLE=True
+    STAT_SPANS = {"detail":"detail","pdf{stage=download}":"pdf","pdf{stage=parse}":"parse","ai_summarize":"AI",
+                  "ai_summarize_batch":"AI batch","sheet_write{kind=rows}":"sheet"}  # span → stats panel label
     class App:
         def __init__(self, root):
-            self.root=root; root.title("CSE Disclosure Tracker v9"); root.geometry("820x700"); root.configure(bg="#f0f0f0")
-            self.running=False; self.gm=None; self._ui(); self._check()
+            self.root=root; root.title("CSE Disclosure Tracker v9"); root.geometry("820x760"); root.configure(bg="#f0f0f0")
+            self.running=False; self.gm=None; self.q=queue.SimpleQueue(); self.t0=None; self.done=self.total=0; self._stats_at=0
+            self._ui(); self._check(); self._drain()
         def _ui(self):
             tk.Label(self.root,text="📊 CSE Disclosure Tracker v9",font=("Helvetica",18,"bold"),bg="#f0f0f0").pack(pady=(10,0))
             tk.Label(self.root,text="Pure API — No Chrome needed!",font=("Helvetica",10),bg="#f0f0f0",fg="#666").pack()
@@ -558,18 +1864,49 @@ def run_gui():
             self.b2=tk.Button(bf,text="🤖  Fix Summaries",command=lambda:self._go(self._fix),font=("Helvetica",13),bg="#4CAF50",fg="white",width=15,height=2); self.b2.pack(side=tk.LEFT,padx=5)
             self.b3=tk.Button(bf,text="📋  Open Sheet",command=self._sheet,font=("Helvetica",13),bg="#FF9800",fg="white",width=12,height=2); self.b3.pack(side=tk.LEFT,padx=5)
             self.b4=tk.Button(bf,text="⏹  Stop",command=self._stop,font=("Helvetica",13),bg="#f44336",fg="white",width=8,height=2,state=tk.DISABLED); self.b4.pack(side=tk.LEFT,padx=5)
+            self.stats=tk.Label(self.root,text="",font=("Courier",10),bg="#f0f0f0",fg="#333",justify=tk.LEFT,anchor="w"); self.stats.pack(fill=tk.X,padx=14)
             self.con=scrolledtext.ScrolledText(self.root,wrap=tk.WORD,font=("Courier",11),bg="#1e1e1e",fg="#00ff00",insertbackground="#00ff00",height=30)
             self.con.pack(padx=10,pady=5,fill=tk.BOTH,expand=True)
             self.st=tk.Label(self.root,text="Ready",font=("Helvetica",10),bg="#f0f0f0",fg="#666"); self.st.pack(pady=(0,5))
-        def log(self,m): self.root.after(0,lambda:(self.con.insert(tk.END,m+"\n"),self.con.see(tk.END)))
+        # Workers only queue log lines; the Tk thread drains them every GUI_DRAIN_MS in one insert and
+        # trims the console to GUI_SCROLLBACK lines.
+        def log(self,m): self.q.put(m)
+        def _drain(self):
+            lines=[]
+            try:
+                while len(lines)<GUI_SCROLLBACK: lines.append(self.q.get_nowait())
+            except queue.Empty: pass
+            if lines:
+                self.con.insert(tk.END,"\n".join(lines)+"\n")
+                n=int(self.con.index("end-1c").split(".")[0])
+                if n>GUI_SCROLLBACK: self.con.delete("1.0",f"{n-GUI_SCROLLBACK}.0")
+                self.con.see(tk.END)
+            if time.time()-self._stats_at>=1: self._stats_at=time.time(); self._stats()
+            self.root.after(GUI_DRAIN_MS,self._drain)
+        def _stats(self):
+            if not self.t0 or not hasattr(METRICS,"report"): return
+            el=time.time()-self.t0; r=METRICS.report(); sp=r["spans"]; g=r["gauges"]
+            try: buf=self.gm.pending() if self.gm else 0
+            except Exception: buf="?"
+            self.stats.config(text=f"{self.done}/{self.total} items · {self.done/el*60 if el else 0:.1f}/min · {int(el)//60}:{int(el)%60:02d} elapsed"
+                f" · {buf} unsent · {len(UPGRADES)} awaiting AI\n"
+                f"queued: gather {g.get('queue{stage=gather}',0):g} · AI batch {g.get('queue{stage=ai}',0):g} · finish {g.get('queue{stage=finish}',0):g}\n"
+                +" · ".join(f"{n} p50 {sp[k]['p50']:.2f}s" for k,n in STAT_SPANS.items() if k in sp))
+        def _progress(self,i,n): self.done,self.total=i,n; self._ss(f"Processing {i}/{n}...")
         def _ss(self,t): self.root.after(0,lambda:self.st.config(text=t))
         def _sb(self,r):
             s=tk.DISABLED if r else tk.NORMAL
             self.root.after(0,lambda:(self.b1.config(state=s),self.b2.config(state=s),self.b4.config(state=tk.NORMAL if r else tk.DISABLED)))
         def _go(self,fn):
+            global METRICS
             if self.running: return
-            self.running=True; self._sb(True); self.con.delete("1.0",tk.END); threading.Thread(target=fn,daemon=True).start()
-        def _stop(self): self.running=False; self.log("\n⏹ Stopping..."); self._ss("Stopped"); self._sb(False)
+            if not (METRICS_FILE or METRICS_PROM): METRICS=Metrics()  # in-memory, for the stats panel
+            CANCEL.clear(); self.running=True; self.t0=time.time(); self.done=self.total=0
+            self._sb(True); self.con.delete("1.0",tk.END); threading.Thread(target=fn,daemon=True).start()
+        def _stop(self):
+            # Sleeps and requests in flight raise Cancelled; buttons come back once the worker has flushed and exited.
+            if not self.running: return
+            self.running=False; CANCEL.set(); self.log("\n⏹ Stopping..."); self._ss("Stopping...")
         def _sheet(self):
             if self.gm: webbrowser.open(self.gm.spreadsheet.url)
             else: messagebox.showinfo("Sheet","Run tracker first.")
@@ -598,17 +1935,12 @@ def run_gui():
                     try: dt=datetime.fromtimestamp(cr/1000); ts=dt.strftime("%I:%M:%S %p")
                     except: ts=""
                     uk=f"{ds}|{ts}|{co}"
-                    if uk not in ek and not any(k.startswith(uk) for k in ek): new.append(it)
+                    if uk not in ek: new.append(it)
                 self.log(f"  {len(new)} NEW")
                 if not new: self.log("  Up to date!")
                 else:
-                    self.log("━"*50); self.log("PROCESSING ROW BY ROW..."); self.log("━"*50)
-                    tot=0
-                    for i,it in enumerate(new):
-                        if not self.running: break
-                        self._ss(f"Processing {i+1}/{len(new)}..."); self.log(f"\n[{i+1}/{len(new)}]")
-                        tot+=process_one_item(self.gm,it,ek,log=self.log)
-                        if i<len(new)-1: time.sleep(SUMMARY_DELAY)
+                    self.log("━"*50); self.log("PROCESSING..."); self.log("━"*50)
+                    tot=process_items(self.gm,new,ek,log=self.log,running_check=lambda:self.running,progress=self._progress)
                     self.log(f"\n  Total: {tot} rows")
                 # Financial reports
                 if self.running:
@@ -621,25 +1953,35 @@ def run_gui():
                             try: fr_added+=process_financial_report(self.gm,it,ek,log=self.log)
                             except Exception as e: self.log(f"    ✗ {e}")
                         self.log(f"  Financial reports: {fr_added} added")
+                self.gm.flush()
                 if self.running: fix_old_summaries(self.gm,items,log=self.log,running_check=lambda:self.running)
+                if self.running: st=load_state(); upgrade_summaries(self.gm,st,log=self.log); self.gm.roll_over(st); save_state(st)
                 self.log("\n"+"═"*50); self.log("✓ ALL DONE!"); self.log("═"*50); self._ss("Complete!")
+            except Cancelled: self.log("⏹ Stopped"); self._ss("Stopped")
             except Exception as e: self.log(f"\n✗ {e}"); import traceback; self.log(traceback.format_exc())
-            finally: self.running=False; self._sb(False)
+            finally:
+                if self.gm: self.gm.flush()
+                flush_sinks(self.log); self.running=False; self._sb(False)
         def _fix(self):
             try:
                 if not self._conn(): self._sb(False); self.running=False; return
                 items=fetch_announcements(log=self.log)
                 fix_old_summaries(self.gm,items,log=self.log,running_check=lambda:self.running)
                 self.log("\n✓ Done!"); self._ss("Complete!")
+            except Cancelled: self.log("⏹ Stopped"); self._ss("Stopped")
             except Exception as e: self.log(f"\n✗ {e}")
             finally: self.running=False; self._sb(False)
-    root=tk.Tk(); App(root); root.mainloop()
+    App(root); root.mainloop()
 
 # ═══════════════════════════════════════════════════════════════════════
 if __name__=="__main__":
-    headless = "--headless" in sys.argv or os.environ.get("SERVICE_ACCOUNT_KEY")
-    if not headless:
-        try: import tkinter; tkinter.Tk().destroy()
-        except: headless=True
-    if headless: run_headless()
+    if "--watch" in sys.argv: run_watch(); sys.exit(0)
+    if "--backfill" in sys.argv:
+        if "--experimental" not in sys.argv: print(BACKFILL_EXPERIMENTAL); sys.exit(2)
+        i=sys.argv.index("--backfill"); sys.exit(run_backfill(*[a for a in sys.argv[i+1:i+3] if not a.startswith("--")]))
+    if "--check" in sys.argv: sys.exit(check())
+    if "--coverage" in sys.argv: structured_coverage(); sys.exit(0)
+    if "--search" in sys.argv: sys.exit(run_search(sys.argv))
+    headless = "--headless" in sys.argv or "--full" in sys.argv or os.environ.get("SERVICE_ACCOUNT_KEY") or not has_display()
+    if headless: run_headless(full="--full" in sys.argv)
     else: run_gui()